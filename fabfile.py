@@ -30,7 +30,10 @@ def deploy(target='dev', sha1=None):
         sudo('%s/bin/pip install -r requirements.txt' % python_env, user='pyconkr')
         sudo('%s/bin/python manage.py compilemessages' % python_env, user='pyconkr')
         sudo('%s/bin/python manage.py migrate' % python_env, user='pyconkr')
+        # fill the denormalized program fields that migrations leave empty
+        sudo('%s/bin/python manage.py backfill_program_fields' % python_env, user='pyconkr')
         sudo('%s/bin/python manage.py collectstatic --noinput' % python_env, user='pyconkr')
+        sudo('%s/bin/python manage.py warm_thumbnails' % python_env, user='pyconkr')
         # worker reload
         run('echo r > /var/run/pyconkr-2016-%s.fifo' % target)
 
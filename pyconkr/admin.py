@@ -10,7 +10,7 @@ from modeltranslation.admin import TranslationAdmin
 from sorl.thumbnail.admin import AdminImageMixin
 from .models import (Room, Program, ProgramTime, ProgramDate, ProgramCategory,
                      Speaker, Sponsor, SponsorLevel,
-                     Profile, Announcement, EmailToken, Proposal, Banner)
+                     Profile, Announcement, EmailToken, Proposal, Banner, QueuedMail)
 
 
 class RoomAdmin(SummernoteModelAdmin, TranslationAdmin):
@@ -64,6 +64,7 @@ admin.site.register(Speaker, SpeakerAdmin)
 
 class ProgramAdmin(SummernoteModelAdmin, TranslationAdmin):
     list_display = ('id', 'name', 'date', 'room', 'get_speakers', 'category', 'is_recordable',)
+    list_select_related = ('date', 'category',)
     list_editable = ('name', 'category', 'is_recordable',)
     ordering = ('id',)
     filter_horizontal = ('times', )
@@ -138,3 +139,10 @@ class BannerAdmin(SummernoteModelAdmin, TranslationAdmin):
     ordering = ('id',)
     search_fields = ('name', 'url')
 admin.site.register(Banner, BannerAdmin)
+
+
+class QueuedMailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'recipients', 'status', 'attempts', 'next_attempt', 'sent')
+    list_filter = ('status',)
+    search_fields = ('subject', 'recipients')
+admin.site.register(QueuedMail, QueuedMailAdmin)
@@ -0,0 +1,10 @@
+from __future__ import unicode_literals
+
+from django.apps import AppConfig
+
+
+class PyconkrConfig(AppConfig):
+    name = 'pyconkr'
+
+    def ready(self):
+        from . import signals  # noqa
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import time
+from django.core.cache import cache
+from .routers import use_primary
+
+VERSION_KEY = 'pyconkr:version:%s'
+
+
+def get_version(namespace):
+    """
+    Return the current cache version of `namespace`.
+
+    Cached values are stored under this version, so bumping it makes every
+    entry of the namespace stale at once without having to know their keys.
+    """
+    key = VERSION_KEY % namespace
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock rather than 1, so an evicted version key can
+        # not bring back entries written under an older version.
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace):
+    key = VERSION_KEY % namespace
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time() * 1000), None)
+
+
+def get_or_build(namespace, key, builder, timeout=None):
+    version = get_version(namespace)
+    value = cache.get(key, version=version)
+    if value is None:
+        with use_primary():
+            value = builder()
+        cache.set(key, value, timeout, version=version)
+    return value
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+from django.conf import settings
+from .caching import get_version
+from .routers import use_primary
+
+
+class ConfigSnapshot(object):
+    """
+    Read-only access to the constance config, e.g. `config.TOTAL_TICKET`.
+
+    All keys are loaded with a single query and kept in the process. The
+    snapshot is reloaded when the 'config' cache version changed, which is
+    checked at most every CONFIG_CHECK_INTERVAL seconds, so reading a value
+    usually costs no query and no cache lookup. Saving a value bumps the
+    version (see `pyconkr.signals`). Values are still written with
+    `constance.config`.
+
+    The version is only seen by the processes sharing the cache, so the
+    snapshot is also reloaded once it is CONFIG_MAX_AGE seconds old.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None  # (values, version, checked at, loaded at)
+
+    def _load(self):
+        from constance import settings as constance_settings
+        from constance.backends.database.models import Constance
+
+        version = get_version('config')
+        values = {key: options[0] for key, options in constance_settings.CONFIG.items()}
+        prefix = constance_settings.DATABASE_PREFIX
+        stored = Constance.objects.filter(key__in=[prefix + key for key in values])
+        with use_primary():
+            stored = list(stored.values_list('key', 'value'))
+        for key, value in stored:
+            values[key[len(prefix):]] = value
+        return values, version
+
+    def _values(self):
+        state = self._state
+        now = time.time()
+        if state is not None:
+            values, version, checked, loaded = state
+            if now - loaded < settings.CONFIG_MAX_AGE:
+                if now - checked < settings.CONFIG_CHECK_INTERVAL:
+                    return values
+                if get_version('config') == version:
+                    self._state = (values, version, now, loaded)
+                    return values
+
+        with self._lock:
+            if self._state is state:
+                values, version = self._load()
+                self._state = (values, version, now, now)
+            return self._state[0]
+
+    def reset(self):
+        self._state = None
+
+    def __getattr__(self, key):
+        if key.startswith('_'):
+            raise AttributeError(key)
+        try:
+            return self._values()[key]
+        except KeyError:
+            raise AttributeError(key)
+
+    def __dir__(self):
+        return self._values().keys()
+
+
+config = ConfigSnapshot()
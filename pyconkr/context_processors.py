@@ -1,122 +1,240 @@
 from django.conf import settings
-from django.contrib.flatpages.models import FlatPage
-from django.db.models import Count
+from django.core.cache import cache
+from django.utils import translation
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 from django.utils.translation import ugettext_lazy as _
 from collections import OrderedDict
-from datetime import datetime
+import math
+from .caching import get_version, get_or_build
+from .routers import use_primary
+from .config import config as config_snapshot
 from .models import SponsorLevel, Speaker, Banner
+from .pages import get_flatpage
+
+
+MENU = OrderedDict([
+    ('about', {
+        'title': _('About'),
+        'icon': 'python',
+        'submenu': OrderedDict([
+            ('pyconkr', {'title': _('About PyCon APAC 2016')}),
+            ('coc', {'title': _('Code of Conduct')}),
+            ('announcements', {'title': _('Announcements')}),
+            ('sponsors', {'title': _('Sponsors')}),
+            ('staff', {'title': _('Staff')}),
+            ('contact', {'title': _('Contact')}),
+        ]),
+    }),
+    ('programs', {
+        'title': _('Programs'),
+        'icon': 'calendar',
+        'submenu': OrderedDict([
+            ('schedule', {'title': _('Schedule')}),
+            ('list', {'title': _('Program list')}),
+            ('keynotes', {'title': _('Keynotes')}),
+            ('speakers', {'title': _('Speakers')}),
+            ('ost', {'title': _('Open Spaces')}),
+        ]),
+    }),
+    ('venue', {
+        'title': _('Venue'),
+        'icon': 'map-marker',
+        'submenu': OrderedDict([
+            ('map', {'title': _('Venue Map')}),
+            ('transportation', {'title': _('Transportation')}),
+            ('hotels', {'title': _('Hotels')}),
+            ('restaurants', {'title': _('Restaurants')}),
+        ]),
+    }),
+    ('cfp', {
+        'title': _('Proposal'),
+        'icon': 'edit',
+        'submenu': OrderedDict([
+            ('cfp', {'title': _('Call for proposals')}),
+            ('howto', {'title': _('How to propose')}),
+            ('propose', {'title': _('Propose')}),
+        ]),
+    }),
+    ('registration', {
+        'title': _('Registration'),
+        'icon': 'book',
+        'submenu': OrderedDict([
+            ('information', {'title': _('Information')}),
+            ('purchase', {'title': _('Purchase a ticket')}),
+            ('finacial-aid', {'title': _('Financial Aid')}),
+        ]),
+    }),
+])
+
+_compiled_menus = {}
+
+
+def _compile_menu(language):
+    """
+    Translate `MENU` for `language` and index it by path.
+
+    The index maps 'section' and 'section/item' to (section, item) so the
+    active entry of a request is found with a dict lookup.
+    """
+    with translation.override(language):
+        menu = OrderedDict()
+        index = {}
+        for k, v in MENU.items():
+            entry = dict(v, title=unicode(v['title']))
+            index[k] = (k, None)
+            if 'submenu' in v:
+                entry['submenu'] = OrderedDict(
+                    (sk, dict(sv, title=unicode(sv['title'])))
+                    for sk, sv in v['submenu'].items())
+                for sk in v['submenu']:
+                    index['{}/{}'.format(k, sk)] = (k, sk)
+            menu[k] = entry
+    return menu, index
+
+
+def get_menu(language):
+    if language not in _compiled_menus:
+        _compiled_menus[language] = _compile_menu(language)
+    return _compiled_menus[language]
+
+
+def _activate(menu, index, path):
+    """
+    Return a copy of `menu` with the entries matching `path` marked active.
+
+    Only the touched sections are copied; the compiled menu itself is shared
+    between requests and never modified.
+    """
+    title = None
+    submenu = None
+    if not path.endswith('/'):
+        return menu, submenu, title
+
+    parts = path.rstrip('/').split('/')
+    section = index.get(parts[-1])
+    item = index.get('/'.join(parts[-2:])) if len(parts) > 1 else None
+    if not section and not item:
+        return menu, submenu, title
+
+    menu = OrderedDict(menu)
+    if section:
+        k = section[0]
+        menu[k] = dict(menu[k], active=True)
+        title = menu[k]['title']
+    if item:
+        k, sk = item
+        menu[k] = dict(menu[k])
+        menu[k]['submenu'] = OrderedDict(menu[k]['submenu'])
+        menu[k]['submenu'][sk] = dict(menu[k]['submenu'][sk], active=True)
+        title = menu[k]['submenu'][sk]['title']
+        submenu = menu[k]['submenu']
+    return menu, submenu, title
+
+
+for language, _name in settings.LANGUAGES:
+    get_menu(language)
+
+
+def _build_sponsor_levels():
+    levels = SponsorLevel.objects.prefetch_related('sponsor_set')
+    return [level for level in levels if level.sponsor_set.all()]
+
+
+def get_sponsor_levels():
+    """
+    Return the sponsor levels that have sponsors, with their sponsors
+    prefetched, from the `sponsors` cache version.
+    """
+    return get_or_build('sponsors', 'sponsors:levels', _build_sponsor_levels,
+                        settings.SPONSOR_CACHE_TIMEOUT)
+
+
+def _build_banners(now):
+    banners = list(Banner.objects.filter(begin__isnull=False, end__gte=now))
+    active = [b for b in banners if b.begin <= now]
+
+    # The list stays valid until the next banner begins or an active one ends.
+    boundaries = [b.begin for b in banners if b.begin > now] + \
+        [b.end for b in active]
+    return active, min(boundaries) if boundaries else None
+
+
+def get_banners():
+    """
+    Return the banners shown right now.
+
+    The cached list expires at the next `begin`/`end` boundary, and whenever a
+    banner is saved or deleted.
+    """
+    now = timezone.now()
+    version = get_version('banners')
+    cached = cache.get('banners:active', version=version)
+    if cached is not None:
+        banners, expires = cached
+        if expires is None or now < expires:
+            return banners
+
+    with use_primary():
+        banners, expires = _build_banners(now)
+    timeout = settings.SPONSOR_CACHE_TIMEOUT
+    if expires is not None:
+        timeout = min(timeout, int(math.ceil((expires - now).total_seconds())))
+    if timeout > 0:
+        cache.set('banners:active', (banners, expires), timeout, version=version)
+    return banners
 
 
 def default(request):
-    title = None
     url = request.path
     if settings.FORCE_SCRIPT_NAME:
         url = url[len(settings.FORCE_SCRIPT_NAME):]
-    base_content = FlatPage.objects.filter(url=url).first()
 
-    submenu = None
-    menu = OrderedDict([
-        ('about', {
-            'title': _('About'),
-            'icon': 'python',
-            'submenu': OrderedDict([
-                ('pyconkr', {'title': _('About PyCon APAC 2016')}),
-                ('coc', {'title': _('Code of Conduct')}),
-                ('announcements', {'title': _('Announcements')}),
-                ('sponsors', {'title': _('Sponsors')}),
-                ('staff', {'title': _('Staff')}),
-                ('contact', {'title': _('Contact')}),
-            ]),
-        }),
-        ('programs', {
-            'title': _('Programs'),
-            'icon': 'calendar',
-            'submenu': OrderedDict([
-                ('schedule', {'title': _('Schedule')}),
-                ('list', {'title': _('Program list')}),
-                ('keynotes', {'title': _('Keynotes')}),
-                ('speakers', {'title': _('Speakers')}),
-                ('ost', {'title': _('Open Spaces')}),
-            ]),
-        }),
-        ('venue', {
-            'title': _('Venue'),
-            'icon': 'map-marker',
-            'submenu': OrderedDict([
-                ('map', {'title': _('Venue Map')}),
-                ('transportation', {'title': _('Transportation')}),
-                ('hotels', {'title': _('Hotels')}),
-                ('restaurants', {'title': _('Restaurants')}),
-            ]),
-        }),
-        ('cfp', {
-            'title': _('Proposal'),
-            'icon': 'edit',
-            'submenu': OrderedDict([
-                ('cfp', {'title': _('Call for proposals')}),
-                ('howto', {'title': _('How to propose')}),
-                ('propose', {'title': _('Propose')}),
-            ]),
-        }),
-        ('registration', {
-            'title': _('Registration'),
-            'icon': 'book',
-            'submenu': OrderedDict([
-                ('information', {'title': _('Information')}),
-                ('purchase', {'title': _('Purchase a ticket')}),
-                ('finacial-aid', {'title': _('Financial Aid')}),
-            ]),
-        }),
-    ])
-
-    for k, v in menu.iteritems():
-        path = '/{}/'.format(k)
-
-        if request.path.endswith(path):
-            v['active'] = True
-            title = v['title']
-
-        if 'submenu' in v:
-            for sk, sv in v['submenu'].iteritems():
-                subpath = '{}{}/'.format(path, sk)
-
-                if request.path.endswith(subpath):
-                    sv['active'] = True
-                    title = sv['title']
-                    submenu = v['submenu']
-
-    now = datetime.now()
-    banners = Banner.objects.filter(begin__lte=now, end__gte=now)
+    def get_base_content():
+        page = get_flatpage(url)
+        return page['content'] if page else ''
+
+    menu, index = get_menu(translation.get_language())
+    menu, submenu, title = _activate(menu, index, request.path)
 
+    # Queries are deferred until a template reads the value, and run at most
+    # once per request.
     return {
         'menu': menu,
         'submenu': submenu,
-        'banners': banners,
+        'banners': SimpleLazyObject(get_banners),
         'title': title,
         'domain': settings.DOMAIN,
-        'base_content': base_content.content if base_content else '',
+        'base_content': SimpleLazyObject(get_base_content),
     }
 
 
 def profile(request):
-    speaker = None
-    programs = None
+    def get_speaker():
+        if request.user.is_authenticated():
+            return Speaker.objects.filter(email=request.user.email).first()
+        return None
 
-    if request.user.is_authenticated():
-        speaker = Speaker.objects.filter(email=request.user.email).first()
+    speaker = SimpleLazyObject(get_speaker)
+
+    def get_programs():
         if speaker:
-            programs = speaker.program_set.all()
+            return list(speaker.program_set.all())
+        return None
 
     return {
         'my_speaker': speaker,
-        'my_programs': programs,
+        'my_programs': SimpleLazyObject(get_programs),
     }
 
 
 def sponsors(request):
-    levels = SponsorLevel.objects.annotate(
-        num_sponsors=Count('sponsor')).filter(num_sponsors__gt=0)
+    return {
+        'levels': SimpleLazyObject(get_sponsor_levels),
+    }
+
 
+def config(request):
     return {
-        'levels': levels,
+        'config': config_snapshot,
     }
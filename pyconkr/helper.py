@@ -1,10 +1,10 @@
 # -*- coding: utf-8 -*-
-from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
 from django.http import HttpResponse
 from django.template import Context
 from django.template.loader import render_to_string, get_template
 import json
+from .mailqueue import enqueue_mail
 
 
 def sendEmailToken(request, token):
@@ -15,13 +15,7 @@ def sendEmailToken(request, token):
     html = get_template('mail/token_html.html').render(variables)
     text = get_template('mail/token_text.html').render(variables)
 
-    msg = EmailMultiAlternatives(
-        settings.EMAIL_LOGIN_TITLE,
-        text,
-        settings.EMAIL_SENDER,
-        [token.email])
-    msg.attach_alternative(html, "text/html")
-    msg.send(fail_silently=False)
+    enqueue_mail(settings.EMAIL_LOGIN_TITLE, text, [token.email], html)
 
 
 def render_json(data_dict):
@@ -40,22 +34,15 @@ def send_email_ticket_confirm(request, payment_info):
     :param payment_info Registration object
     """
     mail_title = u"PyCon APAC 2016 등록확인 안내(Registration confirmation)"
-    product = Product()
     variables = Context({
         'request': request,
         'payment_info': payment_info,
-        'amount': product.price
+        'amount': payment_info.option.price + payment_info.additional_price
     })
     html = get_template('mail/ticket_registered_html.html').render(variables)
     text = get_template('mail/ticket_registered_text.html').render(variables)
 
-    msg = EmailMultiAlternatives(
-        mail_title,
-        text,
-        settings.EMAIL_SENDER,
-        [payment_info.email])
-    msg.attach_alternative(html, "text/html")
-    msg.send(fail_silently=False)
+    enqueue_mail(mail_title, text, [payment_info.email], html)
 
 
 def render_io_error(reason):
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import datetime
+import logging
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.utils import timezone
+from .models import QueuedMail
+
+logger = logging.getLogger(__name__)
+
+# seconds to wait before the first retry, doubled after every failure
+RETRY_DELAY = 60
+# seconds after which a mail claimed by a run that died is queued again
+CLAIM_TIMEOUT = 60 * 10
+
+
+def enqueue_mail(subject, body, recipients, html=None, sender=None):
+    return QueuedMail.objects.create(
+        subject=subject,
+        sender=sender or settings.EMAIL_SENDER,
+        recipients=list(recipients),
+        body=body,
+        html=html or '')
+
+
+def _build_message(mail, connection):
+    msg = EmailMultiAlternatives(mail.subject, mail.body, mail.sender, mail.recipients,
+                                 connection=connection)
+    if mail.html:
+        msg.attach_alternative(mail.html, "text/html")
+    return msg
+
+
+def send_queued_mail(batch_size=100, max_attempts=5):
+    """
+    Send the queued mails that are due, `batch_size` at a time over a single
+    SMTP connection. A failed mail is retried with exponential backoff and
+    given up after `max_attempts`. Returns the number of (sent, failed) mails.
+
+    Every mail is claimed with a conditional UPDATE before it is sent, so
+    overlapping runs never send the same mail twice.
+    """
+    sent = failed = 0
+    QueuedMail.objects.filter(status='sending', next_attempt__lte=timezone.now()) \
+        .update(status='queued')
+    connection = get_connection()
+    connection.open()
+    try:
+        while True:
+            now = timezone.now()
+            mails = list(QueuedMail.objects
+                         .filter(status='queued', next_attempt__lte=now)
+                         .order_by('next_attempt', 'id')[:batch_size])
+            if not mails:
+                break
+
+            for mail in mails:
+                claimed = QueuedMail.objects.filter(pk=mail.pk, status='queued').update(
+                    status='sending', next_attempt=now + datetime.timedelta(seconds=CLAIM_TIMEOUT))
+                if not claimed:
+                    # taken by another run
+                    continue
+                try:
+                    _build_message(mail, connection).send(fail_silently=False)
+                except Exception as e:
+                    logger.warning('Sending mail %d failed: %s', mail.pk, e)
+                    mail.attempts += 1
+                    mail.last_error = unicode(e)
+                    mail.next_attempt = now + datetime.timedelta(
+                        seconds=RETRY_DELAY * 2 ** (mail.attempts - 1))
+                    mail.status = 'failed' if mail.attempts >= max_attempts else 'queued'
+                    mail.save(update_fields=['attempts', 'last_error', 'next_attempt', 'status'])
+                    failed += 1
+                    # the connection may be broken, start a new one
+                    connection.close()
+                    connection.open()
+                else:
+                    QueuedMail.objects.filter(pk=mail.pk).update(
+                        status='sent', sent=timezone.now(), attempts=mail.attempts + 1)
+                    sent += 1
+    finally:
+        connection.close()
+    return sent, failed
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+from pyconkr.models import Program
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized time, room and speaker fields of programs'
+
+    def handle(self, *args, **options):
+        Program.refresh_all_cached_fields()
+        self.stdout.write('%d programs updated' % Program.objects.count())
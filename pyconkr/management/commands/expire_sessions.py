@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from pyconkr.sessions import SessionStore
+
+
+class Command(BaseCommand):
+    help = 'Delete the expired sessions from the database in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.SESSION_CLEAR_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        deleted = SessionStore.clear_expired(options['batch_size'])
+        self.stdout.write('%d expired sessions deleted' % deleted)
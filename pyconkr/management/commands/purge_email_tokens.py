@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from pyconkr.models import EmailToken, UsedLoginToken
+
+
+class Command(BaseCommand):
+    help = 'Delete the email login tokens, and the records of used ones, that are expired'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', default=False,
+                            help='Delete every token, expired or not')
+
+    def handle(self, *args, **options):
+        tokens = EmailToken.objects.all()
+        threshold = timezone.now() - timedelta(seconds=settings.LOGIN_TOKEN_MAX_AGE)
+        if not options['all']:
+            tokens = tokens.filter(created__lt=threshold)
+        deleted, _ = tokens.delete()
+        # signed tokens older than this are rejected by their signature
+        used, _ = UsedLoginToken.objects.filter(used__lt=threshold).delete()
+        self.stdout.write('%d tokens deleted, %d used tokens forgotten' % (deleted, used))
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+from pyconkr.mailqueue import send_queued_mail
+
+
+class Command(BaseCommand):
+    help = 'Send the queued mails over a single SMTP connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--max-attempts', type=int, default=5)
+
+    def handle(self, *args, **options):
+        sent, failed = send_queued_mail(options['batch_size'], options['max_attempts'])
+        self.stdout.write('%d sent, %d failed' % (sent, failed))
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+from pyconkr.thumbnails import warm_all
+
+
+class Command(BaseCommand):
+    help = 'Generate the missing thumbnails of every image in THUMBNAIL_SIZES'
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help='e.g. pyconkr.Speaker, all by default')
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Worker processes, one per CPU by default')
+
+    def handle(self, *args, **options):
+        count, errors = warm_all(options['models'], options['processes'])
+        for error in errors:
+            self.stderr.write(error)
+        self.stdout.write('%d thumbnails, %d errors' % (count, len(errors)))
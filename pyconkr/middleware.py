@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import re
+from collections import Counter
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger('pyconkr.queries')
+
+_fingerprint_patterns = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(\.\d+)?\b'), '?'),
+    (re.compile(r'\bIN \((?:\?, )*\?\)'), 'IN (...)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def fingerprint(sql):
+    """
+    Strip literal values from `sql`, so the same query issued for different
+    rows (the usual N+1 pattern) gets the same fingerprint.
+    """
+    for pattern, replacement in _fingerprint_patterns:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def summarize_queries(queries):
+    fingerprints = Counter(fingerprint(q['sql']) for q in queries)
+    return {
+        'count': len(queries),
+        'time': sum(float(q['time']) for q in queries),
+        'duplicates': {fp: n for fp, n in fingerprints.items() if n > 1},
+    }
+
+
+class QueryInspectMiddleware(object):
+    """
+    Count the queries, total SQL time and duplicated queries of every request.
+
+    The numbers are sent as X-Query-* response headers and logged as JSON on
+    the `pyconkr.queries` logger. Enabled with QUERY_INSPECT_ENABLED.
+    """
+    def __init__(self):
+        if not getattr(settings, 'QUERY_INSPECT_ENABLED', False):
+            raise MiddlewareNotUsed
+
+    def process_request(self, request):
+        request._query_inspect = {}
+        for connection in connections.all():
+            request._query_inspect[connection.alias] = connection.force_debug_cursor
+            connection.force_debug_cursor = True
+            # queries_log is a bounded deque, an offset into it is wrong
+            # once it is full, so start every request from an empty log
+            connection.queries_log.clear()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_inspect_view = '%s.%s' % (
+            view_func.__module__, getattr(view_func, '__name__', view_func.__class__.__name__))
+
+    def process_response(self, request, response):
+        if not hasattr(request, '_query_inspect'):
+            return response
+
+        queries = []
+        for connection in connections.all():
+            queries.extend(connection.queries_log)
+            connection.force_debug_cursor = request._query_inspect.get(
+                connection.alias, connection.force_debug_cursor)
+
+        summary = summarize_queries(queries)
+        response['X-Query-Count'] = str(summary['count'])
+        response['X-Query-Time'] = '%.3f' % summary['time']
+        response['X-Query-Duplicates'] = str(
+            sum(n - 1 for n in summary['duplicates'].values()))
+
+        summary.update({
+            'path': request.path,
+            'view': getattr(request, '_query_inspect_view', None),
+            'status': response.status_code,
+        })
+        logger.info(json.dumps(summary, sort_keys=True), extra={'queries': summary})
+        return response
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 00:09
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pyconkr', '0004_banner'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='program',
+            name='begin',
+            field=models.TimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='program',
+            name='end',
+            field=models.TimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='program',
+            name='room_label',
+            field=models.CharField(blank=True, default=b'', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='program',
+            name='room_label_en',
+            field=models.CharField(blank=True, default=b'', editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='program',
+            name='room_label_ko',
+            field=models.CharField(blank=True, default=b'', editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='program',
+            name='speaker_names',
+            field=models.CharField(blank=True, default=b'', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='program',
+            name='speaker_names_en',
+            field=models.CharField(blank=True, default=b'', editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='program',
+            name='speaker_names_ko',
+            field=models.CharField(blank=True, default=b'', editable=False, max_length=255, null=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 00:32
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pyconkr', '0006_queuedmail'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='emailtoken',
+            name='email',
+            field=models.EmailField(db_index=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 00:53
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pyconkr', '0007_emailtoken_email_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsedLoginToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('used', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
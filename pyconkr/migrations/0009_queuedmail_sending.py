@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 00:56
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pyconkr', '0008_usedlogintoken'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='queuedmail',
+            name='status',
+            field=models.CharField(choices=[(b'queued', 'Queued'), (b'sending', 'Sending'), (b'sent', 'Sent'), (b'failed', 'Failed')], db_index=True, default=b'queued', max_length=10),
+        ),
+    ]
@@ -2,15 +2,18 @@
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.staticfiles.templatetags.staticfiles import static
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.db import models
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.template.defaultfilters import date as _date
+from django.utils import timezone, translation
 from django.utils.translation import ugettext_lazy as _
 from sorl.thumbnail import ImageField as SorlImageField
 from jsonfield import JSONField
 from uuid import uuid4
+from .caching import get_version
 
 
 class Room(models.Model):
@@ -96,7 +99,7 @@ class Speaker(models.Model):
     class Meta:
         ordering = ['name']
 
-    def get_badges(self, size_class=""):
+    def render_badges(self, size_class=""):
         badge = \
             '<a class="btn btn-social btn-social-default {} btn-{}" href="{}" target="_blank">' \
             '<i class="fa fa-external-link fa-{}"></i>{}</a>'
@@ -113,6 +116,32 @@ class Speaker(models.Model):
             ))
         return '<div class="badges">{}</div>'.format(' '.join(result))
 
+    @classmethod
+    def load_badges(cls, speakers, size_class=""):
+        """
+        Fill the badge HTML of `speakers` from the cache with one round trip,
+        rendering and storing only the ones that are missing.
+        """
+        version = get_version('speakers')
+        keys = {'speaker:badges:%s:%s' % (speaker.pk, size_class): speaker
+                for speaker in speakers}
+        cached = cache.get_many(keys.keys(), version=version)
+        missing = {}
+        for key, speaker in keys.items():
+            badges = cached.get(key)
+            if badges is None:
+                badges = missing[key] = speaker.render_badges(size_class)
+            speaker.__dict__.setdefault('_badges', {})[size_class] = badges
+        if missing:
+            cache.set_many(missing, settings.SPEAKER_BADGES_CACHE_TIMEOUT,
+                           version=version)
+
+    def get_badges(self, size_class=""):
+        badges = self.__dict__.get('_badges', {})
+        if size_class not in badges:
+            Speaker.load_badges([self], size_class)
+        return self._badges[size_class]
+
     def get_badges_xs(self):
         return self.get_badges("btn-xs")
 
@@ -147,33 +176,74 @@ class Program(models.Model):
 
     is_recordable = models.BooleanField(default=True)
 
+    # Denormalized from rooms, times and speakers by refresh_cached_fields()
+    begin = models.TimeField(null=True, blank=True, editable=False)
+    end = models.TimeField(null=True, blank=True, editable=False)
+    room_label = models.CharField(max_length=255, blank=True, default='', editable=False)
+    speaker_names = models.CharField(max_length=255, blank=True, default='', editable=False)
+
     def get_absolute_url(self):
         return reverse('program', args=[self.id])
 
     def room(self):
-        rooms = self.rooms.all()
-
-        if rooms.count() == Room.objects.all().count():
-            return ''
-
-        return ', '.join([_.name for _ in self.rooms.all()])
+        return self.room_label
 
     def begin_time(self):
-        return self.times.all()[0].begin.strftime("%H:%M")
+        if self.begin is None:
+            return ''
+        return self.begin.strftime("%H:%M")
 
     def get_speakers(self):
-        return ', '.join([_.name for _ in self.speakers.all()])
+        return self.speaker_names
     get_speakers.short_description = u'Speakers'
 
     def get_times(self):
-        times = self.times.all()
-
-        if times:
-            return '%s - %s' % (times[0].begin.strftime("%H:%M"),
-                                times[len(times) - 1].end.strftime("%H:%M"))
+        if self.begin is not None and self.end is not None:
+            return '%s - %s' % (self.begin.strftime("%H:%M"),
+                                self.end.strftime("%H:%M"))
         else:
             return _("Not arranged yet")
 
+    def refresh_cached_fields(self, room_count=None):
+        """
+        Recompute `begin`, `end`, `room_label` and `speaker_names` from the
+        related rows and store them with an UPDATE, without sending signals.
+
+        `room_label` is empty when the program takes every room, and the
+        labels are stored for each language.
+        """
+        if room_count is None:
+            room_count = Room.objects.count()
+        times = list(self.times.all())
+        rooms = sorted(self.rooms.all(), key=lambda r: r.id)
+        speakers = list(self.speakers.all())
+
+        fields = {
+            'begin': min(t.begin for t in times) if times else None,
+            'end': max(t.end for t in times) if times else None,
+        }
+        for language, _name in settings.LANGUAGES:
+            with translation.override(language):
+                if len(rooms) == room_count:
+                    room_label = ''
+                else:
+                    room_label = ', '.join(r.name for r in rooms)
+                fields['room_label_%s' % language] = room_label[:255]
+                fields['speaker_names_%s' % language] = \
+                    ', '.join(s.name for s in speakers)[:255]
+
+        Program.objects.filter(pk=self.pk).update(**fields)
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+    @classmethod
+    def refresh_all_cached_fields(cls, queryset=None):
+        if queryset is None:
+            queryset = cls.objects.all()
+        room_count = Room.objects.count()
+        for program in queryset.prefetch_related('rooms', 'times', 'speakers'):
+            program.refresh_cached_fields(room_count)
+
     def __unicode__(self):
         return self.name
 
@@ -197,7 +267,7 @@ class Announcement(models.Model):
 
 
 class EmailToken(models.Model):
-    email = models.EmailField(max_length=255)
+    email = models.EmailField(max_length=255, db_index=True)
     token = models.CharField(max_length=64, unique=True)
     created = models.DateTimeField(auto_now_add=True)
 
@@ -206,6 +276,15 @@ class EmailToken(models.Model):
         super(EmailToken, self).save(*args, **kwargs)
 
 
+class UsedLoginToken(models.Model):
+    """
+    A signed login token that was used, kept until it expires so it can not
+    be used again.
+    """
+    digest = models.CharField(max_length=64, unique=True)
+    used = models.DateTimeField(auto_now_add=True, db_index=True)
+
+
 class Proposal(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
 
@@ -274,3 +353,29 @@ class Banner(models.Model):
 
     begin = models.DateTimeField(null=True, blank=True)
     end = models.DateTimeField(null=True, blank=True)
+
+
+class QueuedMail(models.Model):
+    """
+    An outgoing mail, sent by the send_queued_mail command.
+    """
+    subject = models.CharField(max_length=255)
+    sender = models.CharField(max_length=255)
+    recipients = JSONField(default=list)
+    body = models.TextField()
+    html = models.TextField(blank=True)
+    status = models.CharField(max_length=10, default='queued', db_index=True,
+                              choices=(
+                                  ('queued', _('Queued')),
+                                  ('sending', _('Sending')),
+                                  ('sent', _('Sent')),
+                                  ('failed', _('Failed')),
+                              ))
+    attempts = models.IntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now, db_index=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    sent = models.DateTimeField(null=True, blank=True)
+
+    def __unicode__(self):
+        return self.subject
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import hashlib
+from django.conf import settings
+from django.contrib.flatpages.models import FlatPage
+from django.core.cache import cache, caches
+from django.utils import translation
+from django.utils.safestring import mark_safe
+from .caching import get_version
+from .routers import use_primary
+
+MISSING = 'missing'
+
+
+def _load_flatpage(url):
+    page = FlatPage.objects.filter(url=url, sites__id=settings.SITE_ID) \
+        .only('title', 'content', 'template_name', 'registration_required') \
+        .first()
+    if page is None:
+        return MISSING
+
+    return {
+        'url': url,
+        'title': mark_safe(page.title),
+        'content': mark_safe(page.content),
+        'template_name': page.template_name,
+        'registration_required': page.registration_required,
+    }
+
+
+def get_flatpage(url):
+    """
+    Return the flatpage at `url` in the active language as a dict, or None.
+
+    Pages are cached per (url, language) and only the translated fields are
+    kept. URLs without a page are cached too, so unknown paths do not query
+    the database on every request, but briefly and in the separate
+    'missing-pages' cache, so scans of unknown URLs do not evict the rest.
+    """
+    key = 'flatpage:%s:%s' % (translation.get_language(),
+                              hashlib.md5(url.encode('utf-8')).hexdigest())
+    version = get_version('flatpages')
+    missing = caches['missing-pages']
+    page = cache.get(key, version=version)
+    if page is None:
+        if missing.get(key, version=version):
+            return None
+        with use_primary():
+            page = _load_flatpage(url)
+        if page == MISSING:
+            missing.set(key, True, settings.FLATPAGE_MISSING_CACHE_TIMEOUT, version=version)
+            return None
+        cache.set(key, page, settings.FLATPAGE_CACHE_TIMEOUT, version=version)
+    return page
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Send the reads of the public read-only pages to a replica database.
+
+Views decorated with `read_from_replica` read from the DATABASE_REPLICA
+alias; everything else, and every write, uses 'default'. A client that
+wrote something is pinned to 'default' for DATABASE_REPLICA_PIN_SECONDS
+by a cookie, so it reads its own writes while the replica catches up.
+Users and sessions are always read from 'default', as a login or session
+change may not have reached the replica yet.
+"""
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_COOKIE = 'pin_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+# apps whose reads never go to the replica
+PRIMARY_APPS = ('auth', 'sessions')
+
+_local = threading.local()
+
+
+@contextmanager
+def reading_from(alias):
+    previous = getattr(_local, 'alias', None)
+    _local.alias = alias
+    try:
+        yield
+    finally:
+        _local.alias = previous
+
+
+def use_primary():
+    """
+    Read from 'default' inside the block, e.g. to fill a cache that outlives
+    the replica lag.
+    """
+    return reading_from(DEFAULT_DB_ALIAS)
+
+
+def is_pinned(request):
+    return request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES
+
+
+def read_from_replica(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not settings.DATABASE_REPLICA or is_pinned(request):
+            return view(request, *args, **kwargs)
+
+        with reading_from(settings.DATABASE_REPLICA):
+            response = view(request, *args, **kwargs)
+            # template responses run the context processors when rendered
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+        return response
+    return wrapper
+
+
+class ReplicaRouter(object):
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_APPS:
+            return DEFAULT_DB_ALIAS
+        return getattr(_local, 'alias', None)
+
+    def db_for_write(self, model, **hints):
+        _local.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the same rows as 'default'
+        return True
+
+
+class ReplicaPinMiddleware(object):
+    def process_request(self, request):
+        _local.wrote = False
+
+    def process_response(self, request, response):
+        wrote, _local.wrote = getattr(_local, 'wrote', False), False
+        if settings.DATABASE_REPLICA and (wrote or request.method not in SAFE_METHODS):
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.DATABASE_REPLICA_PIN_SECONDS,
+                                httponly=True)
+        return response
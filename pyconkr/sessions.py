@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Session engine reading through the cache and coalescing database writes.
+
+Set SESSION_ENGINE = 'pyconkr.sessions'. Like Django's cached_db engine the
+session is read from the cache and only falls back to the database on a
+miss, but saving a session whose data did not change is skipped until
+SESSION_DB_REFRESH_INTERVAL seconds passed since the row was written.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.core.exceptions import SuspiciousOperation
+from django.utils import timezone
+from django.utils.encoding import force_text
+
+KEY_PREFIX = 'pyconkr.sessions'
+
+
+class SessionStore(CachedDBStore):
+    cache_key_prefix = KEY_PREFIX
+
+    def __init__(self, session_key=None):
+        super(SessionStore, self).__init__(session_key)
+        # (serialized data, time) of the last database write
+        self._written = None
+
+    def _dumps(self, data):
+        return self.serializer().dumps(data)
+
+    def load(self):
+        try:
+            cached = self._cache.get(self.cache_key)
+        except Exception:
+            # memcached raises on invalid keys, start a new session
+            cached = None
+
+        if cached is not None:
+            data, written_at = cached
+            self._written = (self._dumps(data), written_at)
+            return data
+
+        try:
+            s = self.model.objects.get(session_key=self.session_key,
+                                       expire_date__gt=timezone.now())
+            data = self.decode(s.session_data)
+        except (self.model.DoesNotExist, SuspiciousOperation) as e:
+            if isinstance(e, SuspiciousOperation):
+                logging.getLogger('django.security.%s' % e.__class__.__name__).warning(force_text(e))
+            self._session_key = None
+            return {}
+        # unknown write time, the next change is written through
+        self._written = (self._dumps(data), 0)
+        self._cache.set(self.cache_key, (data, 0), self.get_expiry_age(expiry=s.expire_date))
+        return data
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+
+        data = self._get_session(no_load=must_create)
+        serialized = self._dumps(data)
+        if not must_create and self._written is not None:
+            written, written_at = self._written
+            if written == serialized and \
+                    time.time() - written_at < settings.SESSION_DB_REFRESH_INTERVAL:
+                return
+
+        DBStore.save(self, must_create)
+        now = time.time()
+        self._written = (serialized, now)
+        self._cache.set(self.cache_key, (data, now), self.get_expiry_age())
+
+    @classmethod
+    def clear_expired(cls, batch_size=None):
+        """
+        Delete the expired sessions `batch_size` rows at a time, so the
+        database is never locked for long. Returns the number deleted.
+        """
+        batch_size = batch_size or settings.SESSION_CLEAR_BATCH_SIZE
+        sessions = cls.get_model_class().objects
+        now = timezone.now()
+        deleted = 0
+        while True:
+            keys = list(sessions.filter(expire_date__lt=now)
+                        .values_list('session_key', flat=True)[:batch_size])
+            if not keys:
+                return deleted
+            sessions.filter(session_key__in=keys).delete()
+            deleted += len(keys)
@@ -66,6 +66,8 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = [
+    'pyconkr.middleware.QueryInspectMiddleware',
+    'pyconkr.routers.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -77,6 +79,10 @@ MIDDLEWARE_CLASSES = [
     'django.middleware.locale.LocaleMiddleware',
 ]
 
+# Report query count, SQL time and duplicated queries of every request in
+# X-Query-* headers and on the 'pyconkr.queries' logger.
+QUERY_INSPECT_ENABLED = False
+
 ROOT_URLCONF = 'pyconkr.urls'
 
 TEMPLATES = [
@@ -99,7 +105,7 @@ TEMPLATES = [
                 'pyconkr.context_processors.default',
                 'pyconkr.context_processors.sponsors',
                 'pyconkr.context_processors.profile',
-                'constance.context_processors.config',
+                'pyconkr.context_processors.config',
             ],
         },
     },
@@ -116,9 +122,62 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # keep connections open between requests
+        'CONN_MAX_AGE': 60,
     }
 }
 
+# Run on every new SQLite connection, in this order.
+SQLITE_PRAGMAS = (
+    # readers do not wait for the writer, nor the writer for readers
+    ('journal_mode', 'WAL'),
+    # safe with WAL, only a power loss can lose the last commits
+    ('synchronous', 'NORMAL'),
+    # wait this many ms for a lock before "database is locked"
+    ('busy_timeout', 5000),
+    # page cache in KiB (negative) per connection
+    ('cache_size', -20000),
+    ('mmap_size', 256 * 1024 * 1024),
+)
+
+# The public read-only pages read from this DATABASES alias when set, e.g.
+# a 'replica' entry pointing at a copy of db.sqlite3. A client that wrote
+# reads from 'default' for DATABASE_REPLICA_PIN_SECONDS afterwards.
+DATABASE_REPLICA = None
+DATABASE_REPLICA_PIN_SECONDS = 10
+DATABASE_ROUTERS = ['pyconkr.routers.ReplicaRouter']
+
+# Cache
+# https://docs.djangoproject.com/en/1.9/topics/cache/
+# Local-memory by default; switch to
+# 'django.core.cache.backends.filebased.FileBasedCache' with a LOCATION
+# directory to share cached pages between worker processes.
+# Saving a model only invalidates the cache of the process that saved it,
+# so the *_CACHE_TIMEOUT settings below are how long the other processes
+# may show stale content. They can be raised with a shared cache.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pyconkr',
+    },
+    # URLs without a flatpage, kept apart so 404 scans do not evict the
+    # entries of the default cache
+    'missing-pages': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pyconkr-missing-pages',
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+}
+
+# SESSION_ENGINE = 'pyconkr.sessions' reads sessions from the cache and
+# writes them to the database only when they change or
+# SESSION_DB_REFRESH_INTERVAL seconds passed. Only enable it with a cache
+# shared by the worker processes, or a logout in one of them is not seen
+# by the others.
+SESSION_DB_REFRESH_INTERVAL = 60
+SESSION_CLEAR_BATCH_SIZE = 1000
+
 # Password validation
 # https://docs.djangoproject.com/en/1.9/ref/settings/#auth-password-validators
 
@@ -187,6 +246,11 @@ ACCOUNT_EMAIL_REQUIRED = True
 
 DOMAIN = ''
 
+# Email login links are signed tokens valid for LOGIN_TOKEN_MAX_AGE seconds
+# and usable once; False stores EmailToken rows instead.
+LOGIN_TOKEN_SIGNED = True
+LOGIN_TOKEN_MAX_AGE = 60 * 60
+
 EMAIL_LOGIN_TITLE = ugettext("PyCon APAC 2016 one-time login token")
 EMAIL_SENDER = ugettext("PyCon APAC 2016") + "<registration@pycon.kr>"
 EMAIL_USE_TLS = True
@@ -215,6 +279,56 @@ SUMMERNOTE_CONFIG = {
     ),
 }
 
+# Seconds to keep the schedule grid and its rendered HTML (0 disables the
+# HTML fragment cache). Both are invalidated when the timetable is edited.
+SCHEDULE_CACHE_TIMEOUT = 60 * 5
+SCHEDULE_FRAGMENT_CACHE_TIMEOUT = 60 * 5
+
+# Upper bound in seconds for the cached sponsor list and banners. Banners
+# also expire when the next one begins or ends.
+SPONSOR_CACHE_TIMEOUT = 60 * 5
+
+# Seconds to keep flatpage content (and the absence of a flatpage) per URL
+# and language. Saving a flatpage invalidates all of them.
+FLATPAGE_CACHE_TIMEOUT = 60 * 5
+FLATPAGE_MISSING_CACHE_TIMEOUT = 60
+
+# Thumbnails generated by `warm_thumbnails`, as (geometry, options) of the
+# {% thumbnail %} tags showing each model.
+THUMBNAIL_SIZES = {
+    'pyconkr.Speaker': [('128x128', {'crop': 'center'})],
+}
+
+# Seconds to keep the rendered badge links of each speaker.
+SPEAKER_BADGES_CACHE_TIMEOUT = 60 * 5
+
+# Minutes a ticket is held for a user on the payment form. Expired holds are
+# given back by the release_reservations command.
+TICKET_RESERVATION_TIMEOUT = 10
+
+# Seconds to keep the registration window, options and remaining tickets
+# shown on the registration page while it is open, and otherwise (at most
+# until it opens). Saving an option or a config value drops the snapshot.
+REGISTRATION_STATE_CACHE_TIMEOUT = 5
+REGISTRATION_STATE_IDLE_CACHE_TIMEOUT = 60
+
+# Iamport API endpoint, request timeout in seconds and how many times a
+# failed connection is retried. Connections are pooled per process.
+IAMPORT_API_URL = 'https://api.iamport.kr'
+IAMPORT_TIMEOUT = 10
+IAMPORT_MAX_RETRIES = 2
+
+# Fetch a card payment again after charging it. The charge response already
+# has the payment, and the notification endpoint verifies it anyway.
+IAMPORT_CONFIRM_PAYMENT = False
+
+# Seconds between checks whether the constance config loaded by
+# pyconkr.config was changed by another process.
+CONFIG_CHECK_INTERVAL = 1
+# Seconds after which it is reloaded anyway, for the processes that do not
+# share the cache holding the version.
+CONFIG_MAX_AGE = 10
+
 SPEAKER_IMAGE_MAXIMUM_FILESIZE_IN_MB = 5
 SPEAKER_IMAGE_MINIMUM_DIMENSION = (500, 500)
 
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+from constance.backends.database.models import Constance
+from django.conf import settings
+from django.contrib.flatpages.models import FlatPage
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from .caching import bump_version
+from .config import config
+from .models import (Room, Program, ProgramDate, ProgramTime, ProgramCategory, Speaker,
+                     Sponsor, SponsorLevel, Banner)
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+@receiver(post_save, sender=ProgramDate)
+@receiver(post_delete, sender=ProgramDate)
+@receiver(post_save, sender=ProgramTime)
+@receiver(post_delete, sender=ProgramTime)
+@receiver(post_save, sender=ProgramCategory)
+@receiver(post_delete, sender=ProgramCategory)
+@receiver(post_save, sender=Program)
+@receiver(post_delete, sender=Program)
+@receiver(post_save, sender=Speaker)
+@receiver(post_delete, sender=Speaker)
+@receiver(m2m_changed, sender=Program.rooms.through)
+@receiver(m2m_changed, sender=Program.times.through)
+@receiver(m2m_changed, sender=Program.speakers.through)
+def invalidate_timetable(sender, **kwargs):
+    bump_version('timetable')
+
+
+@receiver(post_save, sender=Sponsor)
+@receiver(post_delete, sender=Sponsor)
+@receiver(post_save, sender=SponsorLevel)
+@receiver(post_delete, sender=SponsorLevel)
+def invalidate_sponsors(sender, **kwargs):
+    bump_version('sponsors')
+
+
+@receiver(post_save, sender=Banner)
+@receiver(post_delete, sender=Banner)
+def invalidate_banners(sender, **kwargs):
+    bump_version('banners')
+
+
+@receiver(post_save, sender=FlatPage)
+@receiver(post_delete, sender=FlatPage)
+@receiver(m2m_changed, sender=FlatPage.sites.through)
+def invalidate_flatpages(sender, **kwargs):
+    bump_version('flatpages')
+
+
+@receiver(post_save, sender=Speaker)
+@receiver(post_delete, sender=Speaker)
+def invalidate_speakers(sender, **kwargs):
+    bump_version('speakers')
+
+
+@receiver(m2m_changed, sender=Program.rooms.through)
+@receiver(m2m_changed, sender=Program.times.through)
+@receiver(m2m_changed, sender=Program.speakers.through)
+def refresh_program_fields(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        instance.refresh_cached_fields()
+    elif pk_set:
+        Program.refresh_all_cached_fields(Program.objects.filter(pk__in=pk_set))
+    else:
+        Program.refresh_all_cached_fields()
+
+
+@receiver(post_save, sender=ProgramTime)
+@receiver(post_save, sender=Speaker)
+def refresh_related_program_fields(sender, instance, created, **kwargs):
+    if not created:
+        Program.refresh_all_cached_fields(instance.program_set.all())
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+@receiver(post_delete, sender=ProgramTime)
+@receiver(post_delete, sender=Speaker)
+def refresh_all_program_fields(sender, **kwargs):
+    # Adding or removing a room changes which programs take every room.
+    Program.refresh_all_cached_fields()
+
+
+@receiver(post_save, sender=Constance)
+@receiver(post_delete, sender=Constance)
+def invalidate_config(sender, **kwargs):
+    bump_version('config')
+    config.reset()
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    # the raw cursor keeps the pragmas out of the query log
+    cursor = connection.connection.cursor()
+    for pragma, value in settings.SQLITE_PRAGMAS:
+        cursor.execute('PRAGMA %s = %s' % (pragma, value))
+    cursor.close()
+
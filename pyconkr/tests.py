@@ -1,16 +1,77 @@
 # -*- coding: utf-8 -*-
+import datetime
+import json
+import os
+import re
+import shutil
+import tempfile
+from StringIO import StringIO
 
-from django.test import TestCase
+from PIL import Image
+
+from django.test import TestCase, TransactionTestCase
 from django.http import HttpResponse
-from django.test import Client
+from django.test import Client, RequestFactory
+from django.test.utils import override_settings
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from constance.backends.database.models import Constance
+from constance.test import override_config
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
 from django.core.urlresolvers import reverse_lazy, reverse
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.flatpages.models import FlatPage
+from django.contrib.sessions.models import Session
+from django.utils import timezone
+from django.utils.functional import empty
+from sorl.thumbnail import default as thumbnail_default
 
+from pyconkr.caching import bump_version
+from pyconkr.config import config
+from pyconkr.context_processors import (default, profile, get_sponsor_levels,
+                                        get_banners, _build_banners)
 from pyconkr.helper import render_io_error
+from pyconkr.mailqueue import enqueue_mail, send_queued_mail
+from pyconkr.middleware import summarize_queries
+from pyconkr.pages import get_flatpage
+from pyconkr.routers import PIN_COOKIE, ReplicaRouter, reading_from, use_primary
+from pyconkr.sessions import SessionStore
+from pyconkr.signals import configure_sqlite
+from pyconkr.tokens import make_login_token
+from pyconkr.models import (Room, Program, ProgramDate, ProgramTime, ProgramCategory, Speaker,
+                            Sponsor, SponsorLevel, Banner, EmailToken, QueuedMail, UsedLoginToken)
+from registration.models import Option
+from pyconkr.timetable import (build_timetable, get_timetable,
+                               get_catalogue, group_programs)
 
 User = get_user_model()
 
 
+class QueryBudgetMixin(object):
+    """
+    Assert that a page stays within a fixed number of queries, and report the
+    repeated queries when it does not.
+    """
+    def assertQueryBudget(self, url, budget, data=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, data or {})
+        self.assertLess(response.status_code, 400, url)
+
+        summary = summarize_queries(context.captured_queries)
+        if summary['count'] > budget:
+            duplicates = '\n'.join('%dx %s' % (n, fp)
+                                   for fp, n in summary['duplicates'].items())
+            self.fail('%s ran %d queries (budget %d)\n%s' % (
+                url, summary['count'], budget, duplicates))
+        return response
+
+
 class HelperFunctionTestCase(TestCase):
     def setUp(self):
         pass
@@ -23,6 +84,641 @@ class HelperFunctionTestCase(TestCase):
         self.assertEqual(a.status_code, 406, "render io error status code must be 406")
 
 
+class MenuTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_active_menu_item(self):
+        context = default(self.factory.get('/about/sponsors/'))
+        self.assertTrue(context['menu']['about']['submenu']['sponsors'].get('active'))
+        self.assertEqual(context['submenu'], context['menu']['about']['submenu'])
+        self.assertEqual(context['title'], context['submenu']['sponsors']['title'])
+
+    def test_active_flags_do_not_leak_between_requests(self):
+        default(self.factory.get('/cfp/cfp/'))
+        context = default(self.factory.get('/venue/map/'))
+        self.assertNotIn('active', context['menu']['cfp'])
+        self.assertNotIn('active', context['menu']['cfp']['submenu']['cfp'])
+        self.assertTrue(context['menu']['venue']['submenu']['map']['active'])
+
+
+class LazyContextTest(TestCase):
+    def test_unused_context_is_not_queried(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('robots'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_context_is_queried_once(self):
+        user = User.objects.create_user('speaker', 'speaker@test.com', 'password')
+        Speaker.objects.create(slug='speaker', name='speaker', email=user.email, info={})
+        request = RequestFactory().get('/')
+        request.user = user
+        context = profile(request)
+        with self.assertNumQueries(2):
+            self.assertEqual(context['my_speaker'].slug, 'speaker')
+            self.assertEqual(len(context['my_programs']), 0)
+            self.assertEqual(context['my_speaker'].name, 'speaker')
+            self.assertEqual(len(context['my_programs']), 0)
+
+
+class SponsorBannerCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_sponsor_levels_are_cached(self):
+        level = SponsorLevel.objects.create(name='gold', slug='gold')
+        SponsorLevel.objects.create(name='empty', slug='empty')
+        Sponsor.objects.create(slug='acme', name='acme', level=level)
+        get_sponsor_levels()
+        with self.assertNumQueries(0):
+            levels = get_sponsor_levels()
+            self.assertEqual([l.slug for l in levels], ['gold'])
+            self.assertEqual([s.slug for s in levels[0].sponsor_set.all()], ['acme'])
+
+        Sponsor.objects.create(slug='bolt', name='bolt', level=level)
+        levels = get_sponsor_levels()
+        self.assertEqual(len(levels[0].sponsor_set.all()), 2)
+
+    def test_banners_expire_at_next_boundary(self):
+        now = timezone.now()
+        Banner.objects.create(name='now', begin=now - datetime.timedelta(hours=1),
+                              end=now + datetime.timedelta(hours=1))
+        soon = Banner.objects.create(name='soon', begin=now + datetime.timedelta(seconds=30),
+                                     end=now + datetime.timedelta(hours=1))
+        self.assertEqual([b.name for b in get_banners()], ['now'])
+        with self.assertNumQueries(0):
+            get_banners()
+
+        banners, expires = _build_banners(now)
+        self.assertEqual(expires, soon.begin)
+        banners, expires = _build_banners(soon.begin)
+        self.assertEqual(sorted(b.name for b in banners), ['now', 'soon'])
+
+
+class FlatPageCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['missing-pages'].clear()
+        self.page = FlatPage.objects.create(url='/about/coc/', title='coc', content='be nice')
+        self.page.sites.add(settings.SITE_ID)
+
+    def test_flatpage_is_cached(self):
+        self.assertEqual(get_flatpage('/about/coc/')['content'], 'be nice')
+        with self.assertNumQueries(0):
+            self.assertEqual(get_flatpage('/about/coc/')['title'], 'coc')
+
+    def test_missing_flatpage_is_cached(self):
+        self.assertIsNone(get_flatpage('/nowhere/'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_flatpage('/nowhere/'))
+        self.assertEqual(self.client.get('/nowhere/').status_code, 404)
+        # kept out of the default cache
+        self.assertEqual([key for key in cache._cache if 'flatpage:' in key], [])
+
+    def test_missing_flatpage_is_found_once_created(self):
+        self.assertIsNone(get_flatpage('/new/'))
+        page = FlatPage.objects.create(url='/new/', title='new', content='new page')
+        page.sites.add(settings.SITE_ID)
+        self.assertEqual(get_flatpage('/new/')['content'], 'new page')
+
+    def test_flatpage_is_invalidated_on_save(self):
+        get_flatpage('/about/coc/')
+        self.page.content = 'be excellent'
+        self.page.save()
+        self.assertEqual(get_flatpage('/about/coc/')['content'], 'be excellent')
+
+    def test_flatpage_view(self):
+        response = self.client.get('/about/coc/')
+        self.assertContains(response, 'be nice')
+        self.assertContains(response, '<title>PyCon APAC 2016 coc</title>', html=False)
+
+    def test_unknown_template_falls_back_to_the_default(self):
+        self.page.template_name = 'flatpages/unknown.html'
+        self.page.save()
+        self.assertContains(self.client.get('/about/coc/'), 'be nice')
+
+
+class SpeakerListTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def add_speaker(self, slug):
+        speaker = Speaker.objects.create(slug=slug, name=slug,
+                                         info={'github': 'https://github.com/%s' % slug})
+        Program.objects.create(name='talk of %s' % slug).speakers.add(speaker)
+
+    def test_speaker_list_query_count_does_not_grow(self):
+        self.add_speaker('alice')
+        self.client.get(reverse('speakers'))
+        # speakers and their programs; the layout is served from the cache
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('speakers'))
+        self.assertContains(response, 'https://github.com/alice')
+        self.assertContains(response, 'talk of alice')
+
+        for slug in ('bob', 'carol', 'dave'):
+            self.add_speaker(slug)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('speakers'))
+        self.assertContains(response, 'talk of dave')
+
+    def test_badges_are_refreshed_when_speaker_changes(self):
+        self.add_speaker('alice')
+        speaker = Speaker.objects.get(slug='alice')
+        self.assertIn('github.com/alice', speaker.get_badges_xs())
+
+        speaker.info = {'blog': 'https://alice.example.com'}
+        speaker.save()
+        speaker = Speaker.objects.get(slug='alice')
+        self.assertIn('alice.example.com', speaker.get_badges_xs())
+        self.assertNotIn('github.com/alice', speaker.get_badges_xs())
+
+
+class ProgramCatalogueTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.date = ProgramDate.objects.create(day=datetime.date(2016, 8, 14))
+        self.room = Room.objects.create(name='hall')
+        for slug in ('web', 'data', 'science'):
+            category = ProgramCategory.objects.create(name=slug, slug=slug)
+            for i in range(2):
+                program = Program.objects.create(name='%s %d' % (slug, i),
+                                                 category=category, date=self.date)
+                program.rooms.add(self.room)
+
+    def test_catalogue_query_count(self):
+        with self.assertNumQueries(2):
+            categories = list(get_catalogue())
+            names = [p.name for c in categories for p in c.program_set.all()]
+        self.assertEqual(names[:2], ['data 0', 'data 1'])
+        self.assertEqual(len(names), 6)
+
+    def test_catalogue_grouping(self):
+        with self.assertNumQueries(2):
+            groups = group_programs(get_catalogue('date'), 'date')
+        self.assertEqual(list(groups.keys()), [unicode(self.date)])
+        with self.assertNumQueries(3):
+            groups = group_programs(get_catalogue('room'), 'room')
+        self.assertEqual(len(groups['hall']), 6)
+
+        response = self.client.get(reverse('programs'), {'group': 'room'})
+        self.assertContains(response, '<h3>hall</h3>', html=True)
+
+    def test_catalogue_json_is_cached(self):
+        response = self.client.get(reverse('programs_json'))
+        self.assertEqual(len(json.loads(response.content)['programs']), 6)
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('programs_json'))
+        self.assertEqual(json.loads(response.content)['programs'][0]['rooms'], ['hall'])
+
+
+class ProgramCachedFieldsTest(TestCase):
+    def setUp(self):
+        self.rooms = [Room.objects.create(name='room %d' % i) for i in range(2)]
+        self.times = [ProgramTime.objects.create(name='slot %d' % i,
+                                                 begin=datetime.time(10 + i, 0),
+                                                 end=datetime.time(10 + i, 50))
+                      for i in range(2)]
+        self.speaker = Speaker.objects.create(slug='alice', name='alice', info={})
+        self.program = Program.objects.create(name='talk')
+
+    def test_fields_follow_m2m_changes(self):
+        self.assertEqual(self.program.get_times(), 'Not arranged yet')
+        self.program.times.add(*self.times)
+        self.program.rooms.add(self.rooms[0])
+        self.program.speakers.add(self.speaker)
+
+        program = Program.objects.get(pk=self.program.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(program.get_times(), '10:00 - 11:50')
+            self.assertEqual(program.begin_time(), '10:00')
+            self.assertEqual(program.room(), 'room 0')
+            self.assertEqual(program.get_speakers(), 'alice')
+
+        self.program.rooms.add(self.rooms[1])
+        self.assertEqual(Program.objects.get(pk=self.program.pk).room(), '')
+
+        self.speaker.name = 'alice kim'
+        self.speaker.save()
+        self.assertEqual(Program.objects.get(pk=self.program.pk).get_speakers(), 'alice kim')
+
+    def test_backfill_command(self):
+        self.program.times.add(self.times[1])
+        Program.objects.update(begin=None, end=None)
+        call_command('backfill_program_fields', stdout=StringIO())
+        self.assertEqual(Program.objects.get(pk=self.program.pk).begin_time(), '11:00')
+
+
+class QueryBudgetTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        page = FlatPage.objects.create(url='/index/', title='index', content='index')
+        page.sites.add(settings.SITE_ID)
+
+        date = ProgramDate.objects.create(day=datetime.date(2016, 8, 13))
+        times = [ProgramTime.objects.create(name='slot %d' % i,
+                                            begin=datetime.time(10 + i, 0),
+                                            end=datetime.time(10 + i, 50))
+                 for i in range(4)]
+        rooms = [Room.objects.create(name='room %d' % i) for i in range(3)]
+        category = ProgramCategory.objects.create(name='talk', slug='talk')
+        for i in range(10):
+            speaker = Speaker.objects.create(slug='speaker%d' % i, name='speaker %d' % i,
+                                             info={'github': 'https://github.com/%d' % i})
+            program = Program.objects.create(name='talk %d' % i, date=date, category=category)
+            program.speakers.add(speaker)
+            program.times.add(times[i % 4])
+            program.rooms.add(rooms[i % 3])
+
+        for i in range(3):
+            level = SponsorLevel.objects.create(name='level %d' % i, slug='level%d' % i)
+            for j in range(3):
+                Sponsor.objects.create(slug='sponsor%d%d' % (i, j), name='sponsor', level=level)
+        for i in range(3):
+            Option.objects.create(name='option %d' % i, price=1000, is_active=True)
+        call_command('reconcile_inventory', stdout=StringIO())
+
+    def test_page_query_budgets(self):
+        budgets = [
+            (reverse('index'), 3),
+            (reverse('schedule'), 8),
+            (reverse('speakers'), 4),
+            (reverse('programs'), 3),
+            (reverse('sponsors'), 1),
+            (reverse('registration_index'), 4),
+        ]
+        for url, budget in budgets:
+            self.assertQueryBudget(url, budget)
+
+    def test_query_inspect_middleware(self):
+        with override_settings(QUERY_INSPECT_ENABLED=True):
+            response = Client().get(reverse('speakers'))
+        self.assertIn('X-Query-Count', response)
+        self.assertEqual(response['X-Query-Duplicates'], '0')
+
+        # the same numbers once the query log of the connection is full
+        cache.clear()
+        connection.queries_log.extend(
+            {'sql': 'SELECT 1', 'time': '0.000'} for i in range(connection.queries_limit))
+        with override_settings(QUERY_INSPECT_ENABLED=True):
+            full = Client().get(reverse('speakers'))
+        self.assertEqual(full['X-Query-Count'], response['X-Query-Count'])
+        self.assertEqual(full['X-Query-Duplicates'], '0')
+
+        response = self.client.get(reverse('speakers'))
+        self.assertNotIn('X-Query-Count', response)
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, messages):
+        raise IOError('relay unavailable')
+
+
+# synchronous cannot be changed inside the transaction of a TestCase
+class SQLitePragmaTest(TransactionTestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA %s' % name)
+            return cursor.fetchone()[0]
+
+    def test_pragmas_are_set_on_new_connections(self):
+        pragmas = dict(settings.SQLITE_PRAGMAS)
+        self.assertEqual(self.pragma('busy_timeout'), pragmas['busy_timeout'])
+        self.assertEqual(self.pragma('cache_size'), pragmas['cache_size'])
+
+        with override_settings(SQLITE_PRAGMAS=(('busy_timeout', 1234),)):
+            configure_sqlite(sender=connection.__class__, connection=connection)
+        self.assertEqual(self.pragma('busy_timeout'), 1234)
+        configure_sqlite(sender=connection.__class__, connection=connection)
+        self.assertEqual(self.pragma('busy_timeout'), pragmas['busy_timeout'])
+
+
+class ConfigSnapshotTest(TestCase):
+    def setUp(self):
+        config.reset()
+
+    def test_all_keys_are_read_at_once(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(config.TOTAL_TICKET, settings.CONSTANCE_CONFIG['TOTAL_TICKET'][0])
+            config.IMP_API_KEY
+            config.REGISTRATION_OPEN
+        with self.assertRaises(AttributeError):
+            config.UNKNOWN
+
+    def test_saved_values_are_reloaded(self):
+        config.TOTAL_TICKET
+        with override_config(TOTAL_TICKET=10):
+            self.assertEqual(config.TOTAL_TICKET, 10)
+        self.assertEqual(config.TOTAL_TICKET, settings.CONSTANCE_CONFIG['TOTAL_TICKET'][0])
+
+    def test_other_process_changes_are_checked(self):
+        config.TOTAL_TICKET
+        bump_version('config')
+        with self.assertNumQueries(0):
+            config.TOTAL_TICKET
+        with override_settings(CONFIG_CHECK_INTERVAL=0), self.assertNumQueries(1):
+            config.TOTAL_TICKET
+            config.TOTAL_TICKET
+
+    def test_snapshot_is_reloaded_when_old(self):
+        config.TOTAL_TICKET
+        # changed by a process that does not share this cache
+        Constance.objects.bulk_create([Constance(key='TOTAL_TICKET', value=7)])
+        self.assertNotEqual(config.TOTAL_TICKET, 7)
+        with override_settings(CONFIG_MAX_AGE=0):
+            self.assertEqual(config.TOTAL_TICKET, 7)
+
+
+class MailQueueTest(TestCase):
+    def test_login_only_enqueues_mail(self):
+        response = self.client.post(reverse('login'), {'email': 'test@test.com'})
+        self.assertRedirects(response, reverse('login_mailsent'))
+        self.assertEqual(len(mail.outbox), 0)
+
+        mail_ = QueuedMail.objects.get()
+        self.assertEqual(mail_.recipients, ['test@test.com'])
+        self.assertIn('/login/req/', mail_.body)
+        self.assertFalse(EmailToken.objects.exists())
+
+        out = StringIO()
+        call_command('send_queued_mail', stdout=out)
+        self.assertIn('1 sent, 0 failed', out.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['test@test.com'])
+        self.assertEqual(len(mail.outbox[0].alternatives), 1)
+        self.assertEqual(QueuedMail.objects.get().status, 'sent')
+
+    def test_failed_mail_is_retried_with_backoff(self):
+        enqueue_mail('subject', 'body', ['test@test.com'])
+        with override_settings(EMAIL_BACKEND='pyconkr.tests.FailingEmailBackend'):
+            self.assertEqual(send_queued_mail(max_attempts=2), (0, 1))
+            # not due yet
+            self.assertEqual(send_queued_mail(max_attempts=2), (0, 0))
+
+            QueuedMail.objects.update(next_attempt=timezone.now())
+            self.assertEqual(send_queued_mail(max_attempts=2), (0, 1))
+
+        mail_ = QueuedMail.objects.get()
+        self.assertEqual((mail_.status, mail_.attempts), ('failed', 2))
+        self.assertIn('relay unavailable', mail_.last_error)
+        self.assertEqual(send_queued_mail(), (0, 0))
+
+    def test_claimed_mail_is_not_sent_again(self):
+        enqueue_mail('subject', 'body', ['test@test.com'])
+        # claimed by an overlapping run
+        QueuedMail.objects.update(status='sending',
+                                  next_attempt=timezone.now() + datetime.timedelta(minutes=10))
+        self.assertEqual(send_queued_mail(), (0, 0))
+        self.assertEqual(len(mail.outbox), 0)
+
+        # the run died, the claim expires
+        QueuedMail.objects.update(next_attempt=timezone.now())
+        self.assertEqual(send_queued_mail(), (1, 0))
+        self.assertEqual(QueuedMail.objects.get().status, 'sent')
+
+
+class LoginTokenTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def login_url(self):
+        self.client.post(reverse('login'), {'email': 'test@test.com'})
+        body = QueuedMail.objects.get().body
+        return re.search(r'/login/req/[\w\-:.]+', body).group(0)
+
+    def test_signed_token_logs_in_once(self):
+        url = self.login_url()
+        self.assertFalse(EmailToken.objects.exists())
+
+        response = self.client.get(url)
+        self.assertRedirects(response, reverse('index'))
+        self.assertEqual(get_user_model().objects.get().email, 'test@test.com')
+
+        self.client.logout()
+        # on any worker, whatever is in its cache
+        cache.clear()
+        response = self.client.get(url)
+        self.assertTemplateUsed(response, 'login_notvalidtoken.html')
+        self.assertEqual(UsedLoginToken.objects.count(), 1)
+
+    def test_expired_or_forged_token_is_rejected(self):
+        token = make_login_token('test@test.com').token
+        with override_settings(LOGIN_TOKEN_MAX_AGE=-1):
+            response = self.client.get(reverse('login_req', args=[token]))
+        self.assertTemplateUsed(response, 'login_notvalidtoken.html')
+
+        response = self.client.get(reverse('login_req', args=[token[:-1] + 'x']))
+        self.assertTemplateUsed(response, 'login_notvalidtoken.html')
+        self.assertFalse(get_user_model().objects.exists())
+
+    @override_settings(LOGIN_TOKEN_SIGNED=False)
+    def test_legacy_token(self):
+        self.client.post(reverse('login'), {'email': 'test@test.com'})
+        token = EmailToken.objects.get()
+        response = self.client.get(reverse('login_req', args=[token.token]))
+        self.assertRedirects(response, reverse('index'))
+        self.assertFalse(EmailToken.objects.exists())
+
+    def test_purge_email_tokens(self):
+        EmailToken(email='old@test.com').save()
+        EmailToken(email='new@test.com').save()
+        EmailToken.objects.filter(email='old@test.com').update(
+            created=timezone.now() - datetime.timedelta(days=1))
+
+        out = StringIO()
+        UsedLoginToken.objects.create(digest='old')
+        UsedLoginToken.objects.create(digest='new')
+        UsedLoginToken.objects.filter(digest='old').update(
+            used=timezone.now() - datetime.timedelta(days=1))
+
+        call_command('purge_email_tokens', stdout=out)
+        self.assertIn('1 tokens deleted, 1 used tokens forgotten', out.getvalue())
+        self.assertEqual(UsedLoginToken.objects.get().digest, 'new')
+        self.assertEqual(EmailToken.objects.get().email, 'new@test.com')
+
+        call_command('purge_email_tokens', '--all', stdout=out)
+        self.assertFalse(EmailToken.objects.exists())
+
+
+@override_settings(SESSION_ENGINE='pyconkr.sessions')
+class SessionEngineTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user('test', 'test@test.com', 'test')
+        self.client.login(username='test', password='test')
+
+    def session_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        return [q['sql'] for q in context.captured_queries if 'django_session' in q['sql']]
+
+    def test_session_is_read_from_cache(self):
+        self.assertEqual(self.session_queries(reverse('profile')), [])
+
+        cache.clear()
+        queries = self.session_queries(reverse('profile'))
+        self.assertEqual(len(queries), 1)
+        self.assertTrue(queries[0].startswith('SELECT'))
+        self.assertEqual(self.session_queries(reverse('profile')), [])
+
+    def test_unchanged_session_is_not_written(self):
+        session = SessionStore(self.client.session.session_key)
+        session['count'] = 1
+        session.save()
+        written_at = Session.objects.get().expire_date
+
+        with CaptureQueriesContext(connection) as context:
+            session = SessionStore(self.client.session.session_key)
+            session['count'] = 1
+            session.save()
+        self.assertEqual(len(context.captured_queries), 0)
+
+        with CaptureQueriesContext(connection) as context:
+            session['count'] = 2
+            session.save()
+        self.assertTrue(any(q['sql'].startswith('UPDATE "django_session"')
+                            for q in context.captured_queries))
+        self.assertEqual(SessionStore(session.session_key).load()['count'], 2)
+
+        with override_settings(SESSION_DB_REFRESH_INTERVAL=0):
+            session.save()
+        self.assertGreater(Session.objects.get().expire_date, written_at)
+
+    def test_logout_removes_cached_session(self):
+        session_key = self.client.session.session_key
+        self.client.logout()
+        self.assertEqual(SessionStore(session_key).load(), {})
+        self.assertFalse(Session.objects.exists())
+
+    def test_expire_sessions(self):
+        SessionStore().save()
+        SessionStore().save()
+        Session.objects.update(expire_date=timezone.now() - datetime.timedelta(days=1))
+
+        out = StringIO()
+        call_command('expire_sessions', '--batch-size', '2', stdout=out)
+        self.assertIn('3 expired sessions deleted', out.getvalue())
+        self.assertFalse(Session.objects.exists())
+
+
+class ReplicaRouterTest(TestCase):
+    """
+    The replica is a second SQLite file, holding rows 'default' does not.
+    """
+    @classmethod
+    def setUpClass(cls):
+        super(ReplicaRouterTest, cls).setUpClass()
+        cls.replica_dir = tempfile.mkdtemp()
+        connections.databases['replica'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(cls.replica_dir, 'replica.sqlite3'),
+        }
+        connections.ensure_defaults('replica')
+        call_command('migrate', database='replica', verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections.databases['replica']
+        del connections._connections.replica
+        shutil.rmtree(cls.replica_dir)
+        super(ReplicaRouterTest, cls).tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        Speaker.objects.using('replica').create(slug='replicated', name='replicated', info={})
+
+    def tearDown(self):
+        Speaker.objects.using('replica').all().delete()
+
+    def test_public_pages_read_from_replica(self):
+        with override_settings(DATABASE_REPLICA='replica'):
+            self.assertContains(self.client.get(reverse('speakers')), 'replicated')
+            self.assertNotIn(PIN_COOKIE, self.client.cookies)
+            # not a public read-only page
+            response = self.client.get(reverse('speaker', args=['replicated']))
+            self.assertEqual(response.status_code, 404)
+
+        self.assertNotContains(self.client.get(reverse('speakers')), 'replicated')
+
+    @override_settings(DATABASE_REPLICA='replica')
+    def test_client_reads_its_writes(self):
+        self.client.post(reverse('login'), {'email': 'test@test.com'})
+        self.assertIn(PIN_COOKIE, self.client.cookies)
+        self.assertNotContains(self.client.get(reverse('speakers')), 'replicated')
+
+        del self.client.cookies[PIN_COOKIE]
+        self.assertContains(self.client.get(reverse('speakers')), 'replicated')
+
+    @override_settings(DATABASE_REPLICA='replica')
+    def test_logged_in_user_is_read_from_default(self):
+        # only in 'default', as if the replica had not caught up yet
+        User.objects.create_user('testname', 'test@test.com', 'testpassword')
+        self.client.login(username='testname', password='testpassword')
+        self.assertNotIn(PIN_COOKIE, self.client.cookies)
+
+        response = self.client.get(reverse('speakers'))
+        self.assertContains(response, 'replicated')
+        self.assertTrue(response.context['user'].is_authenticated())
+
+    def test_writes_and_cache_fills_use_default(self):
+        router = ReplicaRouter()
+        with reading_from('replica'):
+            self.assertEqual(router.db_for_read(Speaker), 'replica')
+            self.assertEqual(router.db_for_write(Speaker), 'default')
+            with use_primary():
+                self.assertEqual(router.db_for_read(Speaker), 'default')
+        self.assertIsNone(router.db_for_read(Speaker))
+
+
+class ThumbnailWarmupTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings.enable()
+        # sorl keeps its own storage, made with the MEDIA_ROOT of the time
+        thumbnail_default.storage._wrapped = empty
+
+    def tearDown(self):
+        self.settings.disable()
+        thumbnail_default.storage._wrapped = empty
+        shutil.rmtree(self.media_root)
+
+    def image(self, name):
+        output = StringIO()
+        Image.new('RGB', (400, 300), 'red').save(output, 'JPEG')
+        return SimpleUploadedFile(name, output.getvalue(), 'image/jpeg')
+
+    def thumbnails(self):
+        return [name for root, dirs, files in os.walk(os.path.join(self.media_root, 'cache'))
+                for name in files]
+
+    def test_warm_thumbnails_command(self):
+        Speaker.objects.create(slug='alice', name='alice', info={}, image=self.image('alice.jpg'))
+        Speaker.objects.create(slug='bob', name='bob', info={})
+        # saving does not wait for the resize
+        self.assertEqual(self.thumbnails(), [])
+
+        out = StringIO()
+        call_command('warm_thumbnails', '--processes=1', stdout=out)
+        self.assertIn('1 thumbnails, 0 errors', out.getvalue())
+        self.assertEqual(len(self.thumbnails()), 1)
+
+        response = self.client.get(reverse('speakers'))
+        self.assertContains(response, '/media/cache/')
+        self.assertEqual(len(self.thumbnails()), 1)
+
+    def test_broken_image_does_not_stop_the_warmup(self):
+        broken = SimpleUploadedFile('broken.jpg', b'not an image', 'image/jpeg')
+        Speaker.objects.create(slug='alice', name='alice', info={}, image=broken)
+        Speaker.objects.create(slug='bob', name='bob', info={}, image=self.image('bob.jpg'))
+        out = StringIO()
+        call_command('warm_thumbnails', '--processes=1', stdout=out)
+        self.assertIn('2 thumbnails', out.getvalue())
+        self.assertEqual(len(self.thumbnails()), 1)
+
+
 class PaymentTestCase(TestCase):
     def setUp(self):
         self.client = Client()
@@ -59,3 +755,75 @@ class ProposeTest(TestCase):
         client.login(username='test', password='password')
         response = client.get(reverse('propose'))
         self.assertIn('Please make your profile first', response.content)
+
+
+class ScheduleTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.date = ProgramDate.objects.create(day=datetime.date(2016, 8, 13))
+        self.times = [ProgramTime.objects.create(name='slot %d' % i,
+                                                 begin=datetime.time(10 + i, 0),
+                                                 end=datetime.time(11 + i, 0))
+                      for i in range(3)]
+        self.rooms = [Room.objects.create(name='room %d' % i) for i in range(2)]
+
+    def add_program(self, name, times, rooms):
+        program = Program.objects.create(name=name, date=self.date)
+        program.times.add(*times)
+        program.rooms.add(*rooms)
+        return program
+
+    def test_timetable_grid(self):
+        keynote = self.add_program('keynote', self.times[:1], self.rooms)
+        talk = self.add_program('talk', self.times[1:], self.rooms[:1])
+
+        wide, narrow, rooms = build_timetable()
+
+        self.assertEqual(wide[self.date][self.times[0]][self.rooms[0]], keynote)
+        self.assertNotIn(self.rooms[1], wide[self.date][self.times[0]])
+        self.assertEqual(wide[self.date][self.times[1]][self.rooms[0]], talk)
+        self.assertIsNone(wide[self.date][self.times[1]][self.rooms[1]])
+        self.assertNotIn(self.rooms[0], wide[self.date][self.times[2]])
+        self.assertNotIn(self.times[2], narrow[self.date])
+
+        response = self.client.get(reverse('schedule'))
+        self.assertContains(response, 'keynote')
+
+    def test_timetable_query_count_does_not_grow(self):
+        for i, t in enumerate(self.times):
+            self.add_program('talk %d' % i, [t], self.rooms[:1])
+        with self.assertNumQueries(7):
+            build_timetable()
+
+        for i in range(4):
+            self.rooms.append(Room.objects.create(name='extra %d' % i))
+            self.add_program('extra %d' % i, self.times, self.rooms[-1:])
+        with self.assertNumQueries(7):
+            build_timetable()
+
+    def test_cached_timetable_is_served_without_queries(self):
+        self.add_program('talk', self.times[:1], self.rooms[:1])
+        get_timetable()
+        with self.assertNumQueries(0):
+            wide, narrow, rooms = get_timetable()
+        self.assertEqual(len(rooms), 2)
+
+    def test_cached_timetable_is_invalidated_on_change(self):
+        get_timetable()
+        self.add_program('late talk', self.times[2:], self.rooms[:1])
+        wide, narrow, rooms = get_timetable()
+        self.assertEqual(wide[self.date][self.times[2]][self.rooms[0]].name, 'late talk')
+
+    def test_cached_timetable_with_file_backend(self):
+        location = tempfile.mkdtemp()
+        try:
+            with override_settings(CACHES={'default': {
+                    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                    'LOCATION': location}}):
+                self.add_program('talk', self.times[:1], self.rooms[:1])
+                get_timetable()
+                with self.assertNumQueries(0):
+                    wide, narrow, rooms = get_timetable()
+                self.assertEqual(wide[self.date][self.times[0]][self.rooms[0]].name, 'talk')
+        finally:
+            shutil.rmtree(location)
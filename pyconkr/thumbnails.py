@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Generate the thumbnails of uploaded images ahead of the requests showing
+them. THUMBNAIL_SIZES lists the `{% thumbnail %}` geometries and options
+used by the templates for every model with an image.
+"""
+import logging
+from multiprocessing import Pool
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from sorl.thumbnail import get_thumbnail
+
+logger = logging.getLogger(__name__)
+
+
+def _jobs(labels):
+    for label in labels:
+        model = apps.get_model(label)
+        names = model.objects.exclude(image='').exclude(image__isnull=True) \
+            .values_list('image', flat=True)
+        for name in names:
+            for geometry, options in settings.THUMBNAIL_SIZES[label]:
+                yield name, geometry, options
+
+
+def _warm(job):
+    name, geometry, options = job
+    try:
+        get_thumbnail(name, geometry, **options)
+    except Exception as e:
+        return '%s %s: %s' % (name, geometry, e)
+
+
+def warm_all(labels=None, processes=None):
+    """
+    Generate every configured thumbnail of `labels` (all of THUMBNAIL_SIZES
+    by default) with a pool of `processes`. Returns (thumbnails, errors).
+    """
+    jobs = list(_jobs(labels or sorted(settings.THUMBNAIL_SIZES)))
+    if processes == 1:
+        results = map(_warm, jobs)
+    else:
+        # the workers must not share the connections of this process
+        connections.close_all()
+        pool = Pool(processes)
+        try:
+            results = pool.map(_warm, jobs, chunksize=4)
+        finally:
+            pool.close()
+            pool.join()
+    return len(jobs), [error for error in results if error]
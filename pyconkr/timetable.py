@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+from django.conf import settings
+from django.db.models import Prefetch
+from django.utils import translation
+from django.utils.translation import ugettext as _
+from .caching import get_version, get_or_build
+from .models import Room, Program, ProgramDate, ProgramTime, ProgramCategory
+
+
+def build_timetable():
+    """
+    Build the `wide` and `narrow` schedule grids in a single pass.
+
+    Every program is loaded once together with its dates, rooms, times and
+    speakers, so the number of queries does not depend on how many rooms or
+    time slots the timetable has.
+    """
+    dates = list(ProgramDate.objects.all())
+    times = list(ProgramTime.objects.all())
+    rooms = list(Room.objects.all())
+    programs = Program.objects.filter(date__isnull=False) \
+        .select_related('date') \
+        .prefetch_related('rooms', 'times', 'speakers') \
+        .order_by('id')
+
+    time_order = {t.id: i for i, t in enumerate(times)}
+
+    # (date, time, room) -> first program occupying that cell
+    cells = {}
+    first_time = {}
+    for program in programs:
+        program_times = list(program.times.all())
+        if program_times:
+            first_time[program.id] = min(
+                program_times, key=lambda t: time_order.get(t.id, len(times))).id
+        for t in program_times:
+            for r in program.rooms.all():
+                cells.setdefault((program.date_id, t.id, r.id), program)
+
+    wide = OrderedDict()
+    narrow = OrderedDict()
+    processed = set()
+    for d in dates:
+        wide[d] = OrderedDict()
+        narrow[d] = OrderedDict()
+        for t in times:
+            wide[d][t] = OrderedDict()
+            narrow[d][t] = OrderedDict()
+            for r in rooms:
+                s = cells.get((d.id, t.id, r.id))
+                if s:
+                    if first_time.get(s.id) == t.id and s.id not in processed:
+                        wide[d][t][r] = s
+                        narrow[d][t][r] = s
+                        processed.add(s.id)
+                else:
+                    wide[d][t][r] = None
+
+            if len(narrow[d][t]) == 0:
+                del(narrow[d][t])
+
+    return wide, narrow, rooms
+
+
+def get_timetable():
+    """
+    Return the cached result of `build_timetable()`.
+
+    The grid is stored under the `timetable` cache version, which is bumped
+    whenever a program, date, time, room or speaker changes.
+    """
+    return get_or_build('timetable', 'timetable:grid', build_timetable,
+                        settings.SCHEDULE_CACHE_TIMEOUT)
+
+
+def get_timetable_version():
+    return get_version('timetable')
+
+
+def get_catalogue(group_by=None):
+    """
+    Return program categories with their programs prefetched and sorted.
+
+    Programs are loaded in a single query for all categories; `group_by`
+    ('date' or 'room') additionally prefetches the rooms when needed.
+    """
+    programs = Program.objects.select_related('date').order_by('date__day', 'name')
+    lookups = [Prefetch('program_set', queryset=programs)]
+    if group_by == 'room':
+        lookups.append('program_set__rooms')
+    return ProgramCategory.objects.order_by('name').prefetch_related(*lookups)
+
+
+def group_programs(categories, group_by):
+    """
+    Group the prefetched programs of `categories` by date or room.
+
+    Returns an OrderedDict of label -> programs; programs without a date or
+    room are collected under "Not arranged yet".
+    """
+    groups = {}
+    for category in categories:
+        for program in category.program_set.all():
+            if group_by == 'date':
+                keys = [program.date] if program.date else [None]
+            else:
+                keys = list(program.rooms.all()) or [None]
+            for key in keys:
+                groups.setdefault(key, []).append(program)
+
+    def sort_key(key):
+        if key is None:
+            return (1, None)
+        return (0, key.day if group_by == 'date' else key.id)
+
+    result = OrderedDict()
+    for key in sorted(groups, key=sort_key):
+        label = _("Not arranged yet") if key is None else unicode(key)
+        result[label] = sorted(groups[key], key=lambda p: p.name)
+    return result
+
+
+def _build_catalogue_json():
+    programs = Program.objects.select_related('date', 'category') \
+        .prefetch_related('rooms', 'times', 'speakers') \
+        .order_by('date__day', 'name')
+
+    result = []
+    for program in programs:
+        times = sorted(program.times.all(), key=lambda t: t.begin)
+        result.append({
+            'id': program.id,
+            'name': program.name,
+            'url': program.get_absolute_url(),
+            'category': program.category.slug if program.category else None,
+            'language': program.language,
+            'date': program.date.day.isoformat() if program.date else None,
+            'begin': times[0].begin.strftime("%H:%M") if times else None,
+            'end': times[-1].end.strftime("%H:%M") if times else None,
+            'rooms': [room.name for room in program.rooms.all()],
+            'speakers': [{'slug': speaker.slug, 'name': speaker.name}
+                         for speaker in program.speakers.all()],
+            'slide_url': program.slide_url,
+            'pdf_url': program.pdf_url,
+            'video_url': program.video_url,
+            'is_recordable': program.is_recordable,
+        })
+    return result
+
+
+def get_catalogue_json():
+    """
+    Return the program catalogue as JSON-serializable data in the active
+    language, cached under the `timetable` version.
+    """
+    return get_or_build('timetable',
+                        'timetable:catalogue:%s' % translation.get_language(),
+                        _build_catalogue_json, settings.SCHEDULE_CACHE_TIMEOUT)
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+import hashlib
+from collections import namedtuple
+
+from django.conf import settings
+from django.core import signing
+from django.db import IntegrityError, transaction
+from django.utils.crypto import get_random_string
+from .models import UsedLoginToken
+
+SALT = 'pyconkr.login'
+
+# same attributes as EmailToken, for the mail templates
+LoginToken = namedtuple('LoginToken', ('email', 'token'))
+
+
+def make_login_token(email):
+    """
+    Return a signed login token for `email`. Nothing is stored: the token
+    carries the email and its creation time, and is valid for
+    LOGIN_TOKEN_MAX_AGE seconds.
+    """
+    token = signing.dumps({'e': email, 'n': get_random_string(8)}, salt=SALT, compress=True)
+    return LoginToken(email, token)
+
+
+def use_login_token(token):
+    """
+    Return the email of a valid signed token, or None. A token can be used
+    only once: used tokens are recorded in UsedLoginToken, and deleted by
+    `purge_email_tokens` once expired.
+    """
+    try:
+        data = signing.loads(token, salt=SALT, max_age=settings.LOGIN_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+
+    try:
+        with transaction.atomic():
+            UsedLoginToken.objects.create(digest=hashlib.sha256(token.encode('utf-8')).hexdigest())
+    except IntegrityError:
+        return None
+    return data['e']
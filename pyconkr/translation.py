@@ -45,7 +45,7 @@ translator.register(Speaker, SpeakerTranslationOptions)
 
 
 class ProgramTranslationOptions(TranslationOptions):
-    fields = ('name', 'desc',)
+    fields = ('name', 'desc', 'room_label', 'speaker_names',)
 translator.register(Program, ProgramTranslationOptions)
 
 
@@ -1,19 +1,19 @@
 from django.conf import settings
 from django.conf.urls import patterns, include, url
 from django.conf.urls.static import static
-from django.contrib.flatpages import views
 from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from django.contrib.auth.decorators import login_required
 
-from .views import index, schedule, robots
+from .views import index, schedule, robots, flatpage
 from .views import RoomDetail
 from .views import AnnouncementList, AnnouncementDetail
 from .views import SpeakerList, SpeakerDetail, SpeakerUpdate
 from .views import SponsorList, SponsorDetail
-from .views import ProgramList, ProgramDetail, ProgramUpdate
+from .views import ProgramList, ProgramDetail, ProgramUpdate, program_list_json
 from .views import ProposalCreate, ProposalUpdate, ProposalDetail
 from .views import ProfileDetail, ProfileUpdate
 from .views import login, login_req, login_mailsent, logout
+from .routers import read_from_replica
 
 from django.contrib import admin
 admin.autodiscover()
@@ -28,17 +28,19 @@ urlpatterns = [
     url(r'^about/announcement/(?P<pk>\d+)$',
         AnnouncementDetail.as_view(), name='announcement'),
     url(r'^about/sponsors/$',
-        SponsorList.as_view(), name='sponsors'),
+        read_from_replica(SponsorList.as_view()), name='sponsors'),
     url(r'^about/sponsor/(?P<slug>\w+)$',
         SponsorDetail.as_view(), name='sponsor'),
     url(r'^programs/list/$',
-        ProgramList.as_view(), name='programs'),
+        read_from_replica(ProgramList.as_view()), name='programs'),
+    url(r'^programs/list\.json$',
+        program_list_json, name='programs_json'),
     url(r'^program/(?P<pk>\d+)$',
         ProgramDetail.as_view(), name='program'),
     url(r'^program/(?P<pk>\d+)/edit$',
         ProgramUpdate.as_view(), name='program_edit'),
     url(r'^programs/speakers/$',
-        SpeakerList.as_view(), name='speakers'),
+        read_from_replica(SpeakerList.as_view()), name='speakers'),
     url(r'^programs/speaker/(?P<slug>\w+)$',
         SpeakerDetail.as_view(), name='speaker'),
     url(r'^programs/speaker/(?P<slug>\w+)/edit$',
@@ -57,7 +59,7 @@ urlpatterns = [
         login_required(ProfileUpdate.as_view()), name='profile_edit'),
 
     url(r'^login/$', login, name='login'),
-    url(r'^login/req/(?P<token>[a-z0-9\-]+)$', login_req, name='login_req'),
+    url(r'^login/req/(?P<token>[\w\-:.]+)$', login_req, name='login_req'),
     url(r'^login/mailsent/$', login_mailsent, name='login_mailsent'),
     url(r'^logout/$', logout, name='logout'),
 
@@ -83,5 +85,5 @@ if 'rosetta' in settings.INSTALLED_APPS:
 
 # for flatpages
 urlpatterns += [
-    url(r'^(?P<url>.*/)$', views.flatpage),
+    url(r'^(?P<url>.*/)$', flatpage),
 ]
@@ -4,12 +4,15 @@ from django.conf import settings
 from django.contrib.auth import login as user_login, logout as user_logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.contrib.flatpages.models import FlatPage
+from django.contrib.auth.views import redirect_to_login
+from django.contrib.flatpages.views import DEFAULT_TEMPLATE
 from django.contrib.messages.views import SuccessMessageMixin
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.urlresolvers import reverse
 from django.db.models import Q
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template import loader
 from django.utils.translation import ugettext as _
 from django.views.decorators.cache import never_cache
 from django.views.decorators.csrf import csrf_exempt
@@ -18,8 +21,13 @@ from datetime import datetime, timedelta
 from uuid import uuid4
 from .forms import EmailLoginForm, SpeakerForm, ProgramForm, ProposalForm, ProfileForm
 from .helper import sendEmailToken, render_json, render_io_error
+from .pages import get_flatpage
+from .routers import read_from_replica
+from .tokens import make_login_token, use_login_token
+from .timetable import (get_timetable, get_timetable_version,
+                        get_catalogue, group_programs, get_catalogue_json)
 from .models import (Room,
-                     Program, ProgramDate, ProgramTime, ProgramCategory,
+                     Program, ProgramCategory,
                      Speaker, Sponsor, Announcement,
                      EmailToken, Profile, Proposal)
 from registration.models import Registration
@@ -29,44 +37,43 @@ logger = logging.getLogger(__name__)
 payment_logger = logging.getLogger('payment')
 
 
+@read_from_replica
 def index(request):
+    page = get_flatpage('/index/')
     return render(request, 'index.html', {
-        'base_content': FlatPage.objects.get(url='/index/').content,
+        'base_content': page['content'] if page else '',
         'recent_announcements': Announcement.objects.all()[:3],
     })
 
 
+@read_from_replica
+def flatpage(request, url):
+    if not url.startswith('/'):
+        url = '/' + url
+    page = get_flatpage(url)
+    if page is None:
+        raise Http404
+
+    if page['registration_required'] and not request.user.is_authenticated():
+        return redirect_to_login(request.path)
+
+    if page['template_name']:
+        template = loader.select_template((page['template_name'], DEFAULT_TEMPLATE))
+    else:
+        template = loader.get_template(DEFAULT_TEMPLATE)
+    return HttpResponse(template.render({'flatpage': page}, request))
+
+
+@read_from_replica
 def schedule(request):
-    dates = ProgramDate.objects.all()
-    times = ProgramTime.objects.all()
-    rooms = Room.objects.all()
-
-    wide = {}
-    narrow = {}
-    processed = set()
-    for d in dates:
-        wide[d] = {}
-        narrow[d] = {}
-        for t in times:
-            wide[d][t] = {}
-            narrow[d][t] = {}
-            for r in rooms:
-                s = Program.objects.filter(date=d, times=t, rooms=r)
-                if s:
-                    if s[0].times.all()[0] == t and s[0].id not in processed:
-                        wide[d][t][r] = s[0]
-                        narrow[d][t][r] = s[0]
-                        processed.add(s[0].id)
-                else:
-                    wide[d][t][r] = None
-
-            if len(narrow[d][t]) == 0:
-                del(narrow[d][t])
+    wide, narrow, rooms = get_timetable()
 
     contexts = {
         'wide': wide,
         'narrow': narrow,
         'rooms': rooms,
+        'timetable_version': get_timetable_version(),
+        'fragment_cache_timeout': settings.SCHEDULE_FRAGMENT_CACHE_TIMEOUT,
     }
     return render(request, 'schedule.html', contexts)
 
@@ -86,6 +93,15 @@ class SponsorDetail(DetailView):
 class SpeakerList(ListView):
     model = Speaker
 
+    def get_queryset(self):
+        queryset = super(SpeakerList, self).get_queryset()
+        return queryset.prefetch_related('program_set')
+
+    def get_context_data(self, **kwargs):
+        context = super(SpeakerList, self).get_context_data(**kwargs)
+        Speaker.load_badges(context['object_list'], 'btn-xs')
+        return context
+
 
 class SpeakerDetail(DetailView):
     model = Speaker
@@ -113,6 +129,20 @@ class ProgramList(ListView):
     model = ProgramCategory
     template_name = "pyconkr/program_list.html"
 
+    def get_queryset(self):
+        return get_catalogue(self.request.GET.get('group'))
+
+    def get_context_data(self, **kwargs):
+        context = super(ProgramList, self).get_context_data(**kwargs)
+        group_by = self.request.GET.get('group')
+        if group_by in ('date', 'room'):
+            context['groups'] = group_programs(context['object_list'], group_by)
+        return context
+
+
+def program_list_json(request):
+    return JsonResponse({'programs': get_catalogue_json()})
+
 
 class ProgramDetail(DetailView):
     model = Program
@@ -163,13 +193,16 @@ def login(request):
     if request.method == 'POST':
         form = EmailLoginForm(request.POST)
         if form.is_valid():
-            # Remove previous tokens
             email = form.cleaned_data['email']
-            EmailToken.objects.filter(email=email).delete()
+            if settings.LOGIN_TOKEN_SIGNED:
+                token = make_login_token(email)
+            else:
+                # Remove previous tokens
+                EmailToken.objects.filter(email=email).delete()
 
-            # Create new
-            token = EmailToken(email=email)
-            token.save()
+                # Create new
+                token = EmailToken(email=email)
+                token.save()
 
             sendEmailToken(request, token)
             return redirect(reverse('login_mailsent'))
@@ -182,15 +215,16 @@ def login(request):
 
 @never_cache
 def login_req(request, token):
-    time_threshold = datetime.now() - timedelta(hours=1)
-
-    try:
-        token = EmailToken.objects.get(token=token,
-                                       created__gte=time_threshold)
-    except ObjectDoesNotExist:
-        return render(request, 'login_notvalidtoken.html',
-                      {'title': _('Not valid token')})
-    email = token.email
+    email = use_login_token(token)
+    if email is None:
+        # tokens sent before signed tokens were enabled
+        time_threshold = datetime.now() - timedelta(seconds=settings.LOGIN_TOKEN_MAX_AGE)
+        email_token = EmailToken.objects.filter(token=token, created__gte=time_threshold).first()
+        if email_token is None:
+            return render(request, 'login_notvalidtoken.html',
+                          {'title': _('Not valid token')})
+        email = email_token.email
+        email_token.delete()
 
     # Create user automatically by email as id, token as password
     try:
@@ -199,8 +233,6 @@ def login_req(request, token):
         user = User.objects.create_user(email, email, token)
         user.save()
 
-    token.delete()
-
     # Set backend manually
     user.backend = 'django.contrib.auth.backends.ModelBackend'
     user_login(request, user)
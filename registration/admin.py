@@ -2,7 +2,7 @@
 from django.contrib import admin
 from modeltranslation.admin import TranslationAdmin
 
-from .models import Registration, Option
+from .models import Registration, Option, Inventory, Reservation
 
 
 class OptionAdmin(admin.ModelAdmin):
@@ -18,3 +18,15 @@ class RegistrationAdmin(admin.ModelAdmin):
     list_filter = ('option', 'payment_method', 'payment_status')
     ordering = ('id',)
 admin.site.register(Registration, RegistrationAdmin)
+
+
+class InventoryAdmin(admin.ModelAdmin):
+    list_display = ('option', 'sold', 'reserved', 'modified')
+    readonly_fields = ('sold', 'reserved')
+admin.site.register(Inventory, InventoryAdmin)
+
+
+class ReservationAdmin(admin.ModelAdmin):
+    list_display = ('merchant_uid', 'option', 'user', 'expires')
+    list_filter = ('option',)
+admin.site.register(Reservation, ReservationAdmin)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+import time
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+from django.test.utils import override_settings
+from .iamporter import clear_access_tokens, get_session
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StubIamportServer(object):
+    """
+    A local HTTP server answering like the Iamport API, for tests and load
+    tests. Used as a context manager, it points IAMPORT_API_URL at itself.
+
+    `payments` maps merchant_uid to the payment returned by the find
+    endpoints; charges are added to it as paid. Every request is recorded in
+    `requests`, and answered after `delay` seconds.
+    """
+    token_lifetime = 1800
+    page_size = 2
+
+    def __init__(self, port=0, delay=0):
+        self.payments = {}
+        self.requests = []
+        self.tokens = 0
+        self.delay = delay
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                stub.requests.append(('GET', self.path))
+                self.reply(stub.handle_get(self.path))
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                data = urlparse.parse_qs(self.rfile.read(length))
+                stub.requests.append(('POST', self.path))
+                self.reply(stub.handle_post(self.path, {k: v[0] for k, v in data.items()}))
+
+            def reply(self, result):
+                if stub.delay:
+                    time.sleep(stub.delay)
+                body = json.dumps(result)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.url = 'http://127.0.0.1:%d' % self.server.server_port
+
+    def handle_post(self, path, data):
+        if path == '/users/getToken':
+            with self.lock:
+                self.tokens += 1
+                token = 'token%d' % self.tokens
+            now = int(time.time())
+            return {'code': 0, 'message': None, 'response': {
+                'access_token': token, 'now': now, 'expired_at': now + self.token_lifetime}}
+        elif path in ('/subscribe/payments/onetime/', '/subscribe/payments/foreign/'):
+            payment = {
+                'merchant_uid': data.get('merchant_uid'),
+                'amount': int(data.get('amount', 0)),
+                'status': 'paid',
+                'pay_method': 'card',
+                'pg_tid': 'tid-%s' % data.get('merchant_uid'),
+                'fail_reason': None,
+            }
+            with self.lock:
+                if payment['merchant_uid'] in self.payments:
+                    return {'code': 1, 'message': 'duplicated merchant_uid'}
+                self.payments[payment['merchant_uid']] = payment
+            return {'code': 0, 'message': None, 'response': payment}
+        return {'code': -1, 'message': 'unknown'}
+
+    def handle_get(self, path):
+        url = urlparse.urlparse(path)
+        if url.path.startswith('/payments/find/'):
+            payment = self.payments.get(url.path.split('/')[3])
+            if payment:
+                return {'code': 0, 'message': None, 'response': payment}
+        elif url.path.startswith('/payments/status/'):
+            status = url.path.split('/')[3]
+            page = int(urlparse.parse_qs(url.query).get('page', ['1'])[0])
+            payments = sorted((p for p in self.payments.values() if status in ('all', p['status'])),
+                              key=lambda p: p['merchant_uid'])
+            start = (page - 1) * self.page_size
+            return {'code': 0, 'message': None, 'response': {
+                'total': len(payments),
+                'previous': page - 1,
+                'next': page + 1 if start + self.page_size < len(payments) else 0,
+                'list': payments[start:start + self.page_size]}}
+        return {'code': 1, 'message': 'not found'}
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.settings = override_settings(IAMPORT_API_URL=self.url)
+        self.settings.enable()
+        clear_access_tokens()
+        return self
+
+    def __exit__(self, *args):
+        self.settings.disable()
+        clear_access_tokens()
+        # drop the kept-alive connections to the stub
+        get_session().close()
+        self.server.shutdown()
+        self.server.server_close()
@@ -1 +1 @@
-from iamporter import Iamporter, IamporterError, get_access_token
+from iamporter import Iamporter, IamporterError, get_access_token, get_session, clear_access_tokens
@@ -1,5 +1,20 @@
 # -*- coding: utf-8 -*-
+import threading
+import time
+
 import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+# refresh the access token this many seconds before it expires
+TOKEN_EXPIRY_MARGIN = 60
+
+_session = None
+_session_lock = threading.Lock()
+
+_tokens = {}
+_token_lock = threading.Lock()
 
 
 class IamporterError(Exception):
@@ -8,23 +23,74 @@ class IamporterError(Exception):
         self.message = message
 
 
-def get_access_token(api_key, api_secret):
-    url = 'https://api.iamport.kr/users/getToken'
-    response = requests.post(url, data=dict(
+def get_session():
+    """
+    Return the process-wide requests session, so connections to Iamport are
+    pooled and kept alive between payments.
+
+    Failed connections are retried IAMPORT_MAX_RETRIES times for every
+    method, but only GET requests are retried once they reached the server,
+    so a payment is never sent twice.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = Retry(total=settings.IAMPORT_MAX_RETRIES,
+                              backoff_factor=0.1,
+                              status_forcelist=(502, 503, 504),
+                              method_whitelist=frozenset(['GET']))
+                session = requests.Session()
+                session.mount('https://', HTTPAdapter(max_retries=retry))
+                session.mount('http://', HTTPAdapter(max_retries=retry))
+                _session = session
+    return _session
+
+
+def _url(path):
+    return settings.IAMPORT_API_URL.rstrip('/') + path
+
+
+def _request_access_token(api_key, api_secret):
+    response = get_session().post(_url('/users/getToken'), data=dict(
         imp_key=api_key,
         imp_secret=api_secret,
-    ))
+    ), timeout=settings.IAMPORT_TIMEOUT)
 
     if response.status_code != 200:
         raise IOError  # TODO
 
-    # TODO : validate expire time
     result = response.json()
 
     if result['code'] is not 0:
         raise IamporterError(result['code'], result['message'])
 
-    return result['response']['access_token']
+    token = result['response']
+    # `expired_at` is in the server's clock, so only trust the difference
+    lifetime = token.get('expired_at', 0) - token.get('now', 0)
+    return token['access_token'], time.time() + lifetime - TOKEN_EXPIRY_MARGIN
+
+
+def get_access_token(api_key, api_secret):
+    """
+    Return an access token for `api_key`, reusing the previous one until
+    shortly before it expires. Only one thread fetches a new token.
+    """
+    cached = _tokens.get(api_key)
+    if cached and cached[1] > time.time():
+        return cached[0]
+
+    with _token_lock:
+        cached = _tokens.get(api_key)
+        if cached and cached[1] > time.time():
+            return cached[0]
+        _tokens[api_key] = _request_access_token(api_key, api_secret)
+        return _tokens[api_key][0]
+
+
+def clear_access_tokens():
+    with _token_lock:
+        _tokens.clear()
 
 
 class Iamporter(object):
@@ -56,31 +122,42 @@ class Iamporter(object):
 
     def _get(self, url, data=None, headers=None):
         data, headers = self._set_default(data, headers)
-        response = requests.get(url, headers=headers, params=data)
+        response = get_session().get(_url(url), headers=headers, params=data,
+                                     timeout=settings.IAMPORT_TIMEOUT)
 
         return self._parse_response(response)
 
     def _post(self, url, data=None, headers=None):
         data, headers = self._set_default(data, headers)
-        response = requests.post(url, headers=headers, data=data)
+        response = get_session().post(_url(url), headers=headers, data=data,
+                                      timeout=settings.IAMPORT_TIMEOUT)
 
         return self._parse_response(response)
 
     def onetime(self, **params):
-        url = 'https://api.iamport.kr/subscribe/payments/onetime/'
+        url = '/subscribe/payments/onetime/'
         keys = ['token', 'merchant_uid', 'amount', 'vat', 'card_number', 'expiry', 'birth', 'pwd_2digit',
                 'name', 'remember_me', 'customer_uid', 'buyer_name', 'buyer_email', ]
         data = {k: v for k, v in params.items() if k in keys}
         return self._post(url, data)
 
     def foreign(self, **params):
-        url = 'https://api.iamport.kr/subscribe/payments/foreign/'
+        url = '/subscribe/payments/foreign/'
         keys = ['token', 'merchant_uid', 'amount', 'vat', 'card_number', 'expiry',
                 'name', 'buyer_name', 'buyer_email', ]
         data = {k: v for k, v in params.items() if k in keys}
         return self._post(url, data)
 
     def find_by_merchant_uid(self, merchant_uid):
-        url = 'https://api.iamport.kr/payments/find/{merchant_uid}'.format(merchant_uid=merchant_uid)
+        url = '/payments/find/{merchant_uid}'.format(merchant_uid=merchant_uid)
 
         return self._get(url)
+
+    def find_by_status(self, status, page=1):
+        """
+        Return one page of the payments in `status` ('all', 'ready', 'paid',
+        'cancelled' or 'failed') as a dict with `total`, `next` and `list`.
+        """
+        url = '/payments/status/{status}'.format(status=status)
+
+        return self._get(url, {'page': page})
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from pyconkr.config import config
+
+from .models import Inventory, Option, Registration, Reservation, SOLD_STATUSES
+
+
+class SoldOut(Exception):
+    def __init__(self, option=None):
+        super(SoldOut, self).__init__(option)
+        self.option = option
+
+
+def count_sold(option=None):
+    registrations = Registration.objects.filter(payment_status__in=SOLD_STATUSES)
+    if option is not None:
+        registrations = registrations.filter(option=option)
+    return registrations.count()
+
+
+def get_counter(option=None):
+    """
+    Return the Inventory row of `option` (or the global one), creating it
+    from the Registration table if it does not exist yet.
+    """
+    if option is not None:
+        try:
+            return option.inventory
+        except Inventory.DoesNotExist:
+            pass
+    # by id, so that the new row is not cached on `option` and left stale
+    option_id = option.pk if option is not None else None
+    try:
+        return Inventory.objects.get(option_id=option_id)
+    except Inventory.DoesNotExist:
+        counter, created = Inventory.objects.get_or_create(
+            option_id=option_id, defaults={'sold': count_sold(option)})
+        return counter
+
+
+def get_total(option=None):
+    return config.TOTAL_TICKET if option is None else option.total
+
+
+def remaining(option=None):
+    counter = get_counter(option)
+    return get_total(option) - counter.sold - counter.reserved
+
+
+def _take(option, field='sold'):
+    """
+    Count one more sold (or reserved) ticket, unless `sold + reserved`
+    already reached the total. The check and the increment are a single
+    UPDATE statement, so concurrent buyers can not both get the last ticket.
+    """
+    other = 'reserved' if field == 'sold' else 'sold'
+
+    def update():
+        return Inventory.objects \
+            .filter(option=option, **{field + '__lt': get_total(option) - F(other)}) \
+            .update(**{field: F(field) + 1})
+
+    if not update():
+        get_counter(option)
+        if not update():
+            raise SoldOut(option)
+
+
+def _take_or_sweep(option, field='sold'):
+    """
+    `_take`, giving back the expired reservations first when sold out, so
+    holds nobody released yet do not keep the tickets from being bought.
+    """
+    try:
+        _take(option, field)
+    except SoldOut:
+        if not release_expired():
+            raise
+        _take(option, field)
+
+
+def force_claim(option=None):
+    """
+    Count a sold ticket of `option` even past the totals, for a payment that
+    went through although the tickets were sold out meanwhile.
+    """
+    with transaction.atomic():
+        get_counter(None)
+        Inventory.objects.filter(option=None).update(sold=F('sold') + 1)
+        if option is not None:
+            get_counter(option)
+            Inventory.objects.filter(option=option).update(sold=F('sold') + 1)
+
+
+def _move(option, source, target):
+    changes = {source: F(source) - 1, target: F(target) + 1}
+    Inventory.objects.filter(option=None).update(**changes)
+    if option is not None:
+        Inventory.objects.filter(option=option).update(**changes)
+
+
+def claim(option=None, merchant_uid=None, user=None):
+    """
+    Take a ticket of `option` and of the global inventory, or raise SoldOut
+    and take none. A live reservation of `user` under `merchant_uid` is
+    turned into the sold ticket without checking the totals again.
+    """
+    with transaction.atomic():
+        if merchant_uid and user is not None and Reservation.objects.filter(
+                merchant_uid=merchant_uid, option=option, user=user,
+                expires__gt=timezone.now()).delete()[0]:
+            _move(option, 'reserved', 'sold')
+            return
+
+        _take_or_sweep(None)
+        if option is not None:
+            _take_or_sweep(option)
+
+
+def reserve(option, merchant_uid, user):
+    """
+    Hold a ticket of `option` for TICKET_RESERVATION_TIMEOUT minutes while
+    the user fills in the payment form, or raise SoldOut. Returns the live
+    reservation the user already holds for `option` if there is one, other
+    reservations of the user are given back first.
+    """
+    now = timezone.now()
+    expires = now + datetime.timedelta(minutes=settings.TICKET_RESERVATION_TIMEOUT)
+    with transaction.atomic():
+        held = Reservation.objects.filter(user=user, option=option, expires__gt=now).first()
+        if held is not None:
+            return held
+
+        for previous in Reservation.objects.filter(user=user).select_related('option'):
+            if Reservation.objects.filter(pk=previous.pk).delete()[0]:
+                _give_back(previous.option, 'reserved')
+
+        _take_or_sweep(None, 'reserved')
+        _take_or_sweep(option, 'reserved')
+        return Reservation.objects.create(
+            merchant_uid=merchant_uid, option=option, user=user, expires=expires)
+
+
+def release_expired(now=None):
+    """
+    Delete the expired reservations and give their tickets back in bulk.
+    Returns the number of reservations released.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        expired = list(Reservation.objects.select_for_update()
+                       .filter(expires__lte=now).values_list('id', 'option_id'))
+        per_option = {}
+        for pk, option_id in expired:
+            per_option.setdefault(option_id, []).append(pk)
+
+        # only what this call deleted, a concurrent claim or sweep may have
+        # taken some of the rows already
+        released = 0
+        for option_id, pks in per_option.items():
+            deleted = Reservation.objects.filter(id__in=pks).delete()[0]
+            if deleted:
+                Inventory.objects.filter(option_id=option_id) \
+                    .update(reserved=F('reserved') - deleted)
+                released += deleted
+        if released:
+            Inventory.objects.filter(option=None).update(reserved=F('reserved') - released)
+    return released
+
+
+def _give_back(option, field):
+    Inventory.objects.filter(option=None, **{field + '__gt': 0}).update(**{field: F(field) - 1})
+    if option is not None:
+        Inventory.objects.filter(option=option, **{field + '__gt': 0}).update(**{field: F(field) - 1})
+
+
+def release(option=None):
+    with transaction.atomic():
+        _give_back(option, 'sold')
+
+
+def reconcile():
+    """
+    Reset the sold counters from the Registration table. Returns a list of
+    (counter, old value) for the counters that were off.
+    """
+    changed = []
+    for option in [None] + list(Option.objects.all()):
+        with transaction.atomic():
+            counter = get_counter(option)
+            counter = Inventory.objects.select_for_update().get(pk=counter.pk)
+            sold = count_sold(option)
+            if counter.sold != sold:
+                changed.append((counter, counter.sold))
+                counter.sold = sold
+                counter.save(update_fields=['sold', 'modified'])
+    return changed
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+import datetime
+import math
+import re
+import threading
+import time
+from importlib import import_module
+from multiprocessing.pool import ThreadPool
+from SocketServer import ThreadingMixIn
+
+import requests
+from constance import config
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.servers.basehttp import WSGIRequestHandler, WSGIServer, get_internal_wsgi_application
+from django.core.urlresolvers import reverse
+
+from .models import Option, Registration, Reservation, SOLD_STATUSES
+
+PREFIX = 'loadtest-'
+ENDPOINTS = ('registration_index', 'registration_payment', 'payment_process')
+
+
+def seed(users, tickets, price=10000):
+    """
+    Replace the load test users and option with `users` fresh users and one
+    option of `tickets` tickets. Returns (sessions keys of the users, option).
+    """
+    Registration.objects.filter(user__username__startswith=PREFIX).delete()
+    Reservation.objects.filter(user__username__startswith=PREFIX).delete()
+    Option.objects.filter(name__startswith=PREFIX).delete()
+    User.objects.filter(username__startswith=PREFIX).delete()
+
+    User.objects.bulk_create(User(username='%s%d' % (PREFIX, i),
+                                  email='%s%d@example.com' % (PREFIX, i))
+                             for i in range(users))
+    option = Option.objects.create(name=PREFIX + 'ticket', description='', price=price,
+                                   total=tickets, is_active=True)
+
+    engine = import_module(settings.SESSION_ENGINE)
+    backend = settings.AUTHENTICATION_BACKENDS[0]
+    session_keys = []
+    for user in User.objects.filter(username__startswith=PREFIX).order_by('pk'):
+        session = engine.SessionStore()
+        session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+        session[BACKEND_SESSION_KEY] = backend
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        session_keys.append(session.session_key)
+    return session_keys, option
+
+
+def open_registration():
+    """
+    Open the registration from now until tomorrow. Returns the previous
+    settings for `restore_registration`.
+    """
+    keys = ('REGISTRATION_OPEN', 'REGISTRATION_OPEN_TIME',
+            'REGISTRATION_CLOSE', 'REGISTRATION_CLOSE_TIME')
+    previous = {key: getattr(config, key) for key in keys}
+    now = datetime.datetime.now()
+    config.REGISTRATION_OPEN = now.date()
+    config.REGISTRATION_OPEN_TIME = datetime.time(0, 0)
+    config.REGISTRATION_CLOSE = now.date() + datetime.timedelta(days=1)
+    config.REGISTRATION_CLOSE_TIME = datetime.time(23, 59)
+    return previous
+
+
+def restore_registration(previous):
+    for key, value in previous.items():
+        setattr(config, key, value)
+
+
+class ThreadedWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietWSGIRequestHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def start_server(port=0):
+    """
+    Serve the site from a thread, one thread per request. Returns the server,
+    its URL is `http://127.0.0.1:<server.server_port>`.
+    """
+    server = ThreadedWSGIServer(('127.0.0.1', port), QuietWSGIRequestHandler)
+    server.set_app(get_internal_wsgi_application())
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+class Stats(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {name: [] for name in ENDPOINTS}
+        self.outcomes = {}
+
+    def add(self, endpoint, latency, response):
+        queries = response.headers.get('X-Query-Count') if response is not None else None
+        status = response.status_code if response is not None else None
+        with self.lock:
+            self.requests[endpoint].append(
+                (latency, status, int(queries) if queries is not None else None))
+
+    def outcome(self, name):
+        with self.lock:
+            self.outcomes[name] = self.outcomes.get(name, 0) + 1
+
+
+def _request(stats, endpoint, method, url, **kwargs):
+    start = time.time()
+    try:
+        response = method(url, timeout=60, **kwargs)
+    except requests.RequestException:
+        response = None
+    stats.add(endpoint, time.time() - start, response)
+    return response
+
+
+def buy_ticket(base_url, session_key, option, email, stats, payment_method='card'):
+    """
+    Walk one user through the registration page, the payment form and the
+    payment, and record the outcome in `stats`.
+    """
+    client = requests.Session()
+    client.cookies.set(settings.SESSION_COOKIE_NAME, session_key)
+
+    response = _request(stats, 'registration_index', client.get,
+                        base_url + reverse('registration_index'))
+    if response is None or response.status_code != 200:
+        return stats.outcome('error')
+
+    response = _request(stats, 'registration_payment', client.get,
+                        base_url + reverse('registration_payment', args=[option.pk]))
+    if response is None or response.status_code != 200:
+        return stats.outcome('error')
+    uid = re.search(r"merchant_uid: '([0-9a-f]{32})'", response.text)
+    if uid is None:
+        # sent back to the registration page, no seat left
+        return stats.outcome('sold out')
+
+    csrf_token = client.cookies.get(settings.CSRF_COOKIE_NAME, '')
+    response = _request(stats, 'payment_process', client.post,
+                        base_url + reverse('registration_payment'), data={
+                            'csrfmiddlewaretoken': csrf_token,
+                            'merchant_uid': uid.group(1),
+                            'token': 'token',
+                            'card_number': '4111-1111-1111-1111',
+                            'expiry': '2020-12',
+                            'birth': '',
+                            'name': 'Load Test',
+                            'email': email,
+                            'base_price': option.price,
+                            'additional_price': 0,
+                            'company': '',
+                            'phone_number': '010-0000-0000',
+                            'payment_method': payment_method,
+                            'option': option.pk,
+                        }, headers={'Referer': base_url})
+    if response is None or response.status_code != 200:
+        return stats.outcome('error')
+    stats.outcome('bought' if response.json().get('success') else 'rejected')
+
+
+def run(base_url, session_keys, option, workers, payment_method='card'):
+    """
+    Run `buy_ticket` for every session with `workers` concurrent users.
+    Returns (stats, seconds taken).
+    """
+    stats = Stats()
+    emails = dict(User.objects.filter(username__startswith=PREFIX).values_list('pk', 'email'))
+    emails = [emails[pk] for pk in sorted(emails)]
+
+    pool = ThreadPool(workers)
+    start = time.time()
+    try:
+        pool.map(lambda args: buy_ticket(base_url, args[0], option, args[1], stats, payment_method),
+                 zip(session_keys, emails), chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    return stats, time.time() - start
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[max(0, int(math.ceil(p / 100.0 * len(values))) - 1)]
+
+
+def oversold(option):
+    """
+    Return how many tickets were sold beyond the totals of `option` and of
+    the whole conference.
+    """
+    sold = Registration.objects.filter(payment_status__in=SOLD_STATUSES)
+    return (max(0, sold.filter(option=option).count() - option.total),
+            max(0, sold.count() - config.TOTAL_TICKET))
+
+
+def report(stats, elapsed, option):
+    lines = ['%-22s %8s %7s %9s %9s %9s %9s' % (
+        'endpoint', 'requests', 'errors', 'p50', 'p95', 'p99', 'queries')]
+    total = 0
+    for endpoint in ENDPOINTS:
+        results = stats.requests[endpoint]
+        total += len(results)
+        latencies = [latency * 1000 for latency, status, queries in results]
+        errors = len([1 for latency, status, queries in results if status is None or status >= 400])
+        queries = [q for latency, status, q in results if q is not None]
+        lines.append('%-22s %8d %7d %7.1fms %7.1fms %7.1fms %9s' % (
+            endpoint, len(results), errors,
+            percentile(latencies, 50), percentile(latencies, 95), percentile(latencies, 99),
+            sum(queries) if queries else '-'))
+
+    lines.append('')
+    lines.append('%d requests in %.1fs, %.1f requests/s' % (
+        total, elapsed, total / elapsed if elapsed else 0))
+    lines.append(', '.join('%s: %d' % item for item in sorted(stats.outcomes.items())))
+    lines.append('oversold: %d of the option, %d in total' % oversold(option))
+    return '\n'.join(lines)
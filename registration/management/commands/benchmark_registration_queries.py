@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from registration.models import Option, Registration, SOLD_STATUSES
+
+PREFIX = 'bench-'
+STATUSES = ('paid', 'ready', 'failed', 'cancelled')
+
+
+class Command(BaseCommand):
+    help = ('Time the hot Registration queries with and without indexes. '
+            'Inserts (and deletes afterwards) fake rows, use a development database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        User.objects.bulk_create(User(username='%s%d' % (PREFIX, i)) for i in range(1000))
+        users = list(User.objects.filter(username__startswith=PREFIX))
+        # most visitors of the registration page have not registered yet
+        unregistered = User.objects.create(username=PREFIX + 'unregistered')
+        bench_options = [Option.objects.create(name='%s%d' % (PREFIX, i), description='', price=0)
+                         for i in range(3)]
+        try:
+            self.stdout.write('%8s  %-20s %12s %12s' % ('rows', 'query', 'no index', 'indexed'))
+            inserted = 0
+            for rows in sorted(options['rows']):
+                self._insert(users, bench_options, inserted, rows)
+                inserted = rows
+                for name, before, after in self._measure(unregistered, bench_options[0],
+                                                         options['repeat']):
+                    self.stdout.write('%8d  %-20s %10.3fms %10.3fms' % (rows, name, before, after))
+        finally:
+            Registration.objects.filter(merchant_uid__startswith=PREFIX).delete()
+            Option.objects.filter(pk__in=[o.pk for o in bench_options]).delete()
+            User.objects.filter(username__startswith=PREFIX).delete()
+
+    def _insert(self, users, bench_options, start, end):
+        batch = []
+        for i in range(start, end):
+            batch.append(Registration(
+                user=users[i % len(users)],
+                option=bench_options[i % len(bench_options)],
+                merchant_uid='%s%d' % (PREFIX, i),
+                payment_status=STATUSES[i % len(STATUSES)]))
+            if len(batch) == 1000:
+                Registration.objects.bulk_create(batch)
+                batch = []
+        Registration.objects.bulk_create(batch)
+
+    def _measure(self, user, option, repeat):
+        """
+        Run every query on the registration table and on an unindexed copy
+        of it, returning (name, median ms without indexes, median ms with).
+        """
+        table = Registration._meta.db_table
+        copy = table + '_bench'
+        queries = [
+            ('sold count', Registration.objects.filter(
+                option=option, payment_status__in=SOLD_STATUSES).values('pk').order_by()),
+            ('is registered', Registration.objects.filter(
+                user=user, payment_status__in=SOLD_STATUSES).values('pk').order_by()[:1]),
+            ('by merchant_uid', Registration.objects.filter(
+                merchant_uid=PREFIX + '1').values('pk').order_by()),
+        ]
+
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TABLE %s AS SELECT * FROM %s' % (quote(copy), quote(table)))
+            try:
+                results = []
+                for name, queryset in queries:
+                    sql, params = queryset.query.sql_with_params()
+                    if name == 'sold count':
+                        sql = 'SELECT COUNT(*) FROM (%s) counted' % sql
+                    timings = []
+                    for target in (copy, table):
+                        timings.append(self._time(
+                            cursor, sql.replace(quote(table), quote(target)), params, repeat))
+                    results.append((name,) + tuple(timings))
+                return results
+            finally:
+                cursor.execute('DROP TABLE %s' % quote(copy))
+
+    def _time(self, cursor, sql, params, repeat):
+        timings = []
+        for i in range(repeat):
+            start = time.time()
+            cursor.execute(sql, params)
+            cursor.fetchall()
+            timings.append((time.time() - start) * 1000)
+        return sorted(timings)[len(timings) // 2]
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections, transaction
+from django.db.models import F
+from django.test.utils import override_settings
+from registration.models import Inventory, Option, Registration, SOLD_STATUSES
+
+ALIAS = 'sqlite_benchmark'
+# what a fresh SQLite file does without the connection hook
+DEFAULT_PRAGMAS = (
+    ('journal_mode', 'DELETE'),
+    ('synchronous', 'FULL'),
+)
+
+
+class Command(BaseCommand):
+    help = ('Run concurrent readers and writers on the registration tables of a '
+            'scratch SQLite file, with SQLite defaults and with SQLITE_PRAGMAS.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--users', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp()
+        try:
+            template = os.path.join(directory, 'template.sqlite3')
+            with self._database(template):
+                with connections[ALIAS].schema_editor() as editor:
+                    for model in (User, Option, Inventory, Registration):
+                        editor.create_model(model)
+                self._seed(options['users'])
+
+            self.stdout.write('%-10s %10s %10s %10s %10s' % (
+                'pragmas', 'reads/s', 'writes/s', 'p95 write', 'locked'))
+            for name, pragmas in (('defaults', DEFAULT_PRAGMAS),
+                                  ('tuned', settings.SQLITE_PRAGMAS)):
+                path = os.path.join(directory, '%s.sqlite3' % name)
+                shutil.copy(template, path)
+                with override_settings(SQLITE_PRAGMAS=pragmas), self._database(path):
+                    reads, writes, latencies, locked = self._run(options)
+                latencies.sort()
+                p95 = latencies[int(len(latencies) * 0.95)] if latencies else 0
+                self.stdout.write('%-10s %10.1f %10.1f %8.1fms %10d' % (
+                    name, reads / options['seconds'], writes / options['seconds'],
+                    p95 * 1000, locked))
+        finally:
+            shutil.rmtree(directory)
+
+    @contextmanager
+    def _database(self, path):
+        connections.databases[ALIAS] = dict(connections.databases['default'], NAME=path,
+                                            CONN_MAX_AGE=0, TEST={})
+        connections.ensure_defaults(ALIAS)
+        try:
+            yield
+        finally:
+            self._close()
+            del connections.databases[ALIAS]
+
+    def _close(self):
+        if hasattr(connections._connections, ALIAS):
+            connections[ALIAS].close()
+            delattr(connections._connections, ALIAS)
+
+    def _seed(self, users):
+        User.objects.using(ALIAS).bulk_create(
+            User(username='bench-%d' % i) for i in range(users))
+        option = Option.objects.using(ALIAS).create(name='bench', description='', price=0,
+                                                    is_active=True)
+        Inventory.objects.using(ALIAS).create(option=option)
+
+    def _run(self, options):
+        user_ids = list(User.objects.using(ALIAS).values_list('pk', flat=True))
+        option = Option.objects.using(ALIAS).get()
+        self._close()
+
+        lock = threading.Lock()
+        totals = {'reads': 0, 'writes': 0, 'locked': 0, 'latencies': []}
+        deadline = time.time() + options['seconds']
+
+        def read(i):
+            user_id = user_ids[i % len(user_ids)]
+            list(Option.objects.using(ALIAS).filter(is_active=True).select_related('inventory'))
+            Registration.objects.using(ALIAS).filter(
+                user_id=user_id, payment_status__in=SOLD_STATUSES).exists()
+
+        def write(i):
+            with transaction.atomic(using=ALIAS):
+                Registration.objects.using(ALIAS).create(
+                    user_id=user_ids[i % len(user_ids)], option=option,
+                    merchant_uid=uuid.uuid4().hex, name='bench', email='bench@example.com',
+                    phone_number='', transaction_code='', payment_status='paid')
+                Inventory.objects.using(ALIAS).filter(option=option).update(sold=F('sold') + 1)
+
+        def worker(operation, counter, seed):
+            done = locked = 0
+            latencies = []
+            i = seed
+            try:
+                while time.time() < deadline:
+                    start = time.time()
+                    try:
+                        operation(i)
+                    except OperationalError:
+                        locked += 1
+                    else:
+                        done += 1
+                        latencies.append(time.time() - start)
+                    i += 7
+            finally:
+                self._close()
+            with lock:
+                totals[counter] += done
+                totals['locked'] += locked
+                if counter == 'writes':
+                    totals['latencies'].extend(latencies)
+
+        threads = [threading.Thread(target=worker, args=(read, 'reads', i))
+                   for i in range(options['readers'])]
+        threads += [threading.Thread(target=worker, args=(write, 'writes', i))
+                    for i in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return totals['reads'], totals['writes'], totals['latencies'], totals['locked']
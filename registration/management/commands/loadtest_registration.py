@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from registration import loadtest
+from registration.iamport_stub import StubIamportServer
+
+
+class Command(BaseCommand):
+    help = ('Simulate the ticket opening rush against a fake Iamport server and report '
+            'latency, throughput, query counts and oversold tickets. Replaces the load test '
+            'users and option and opens the registration, use a development database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--tickets', type=int, default=100)
+        parser.add_argument('--workers', type=int, default=20,
+                            help='Users buying at the same time')
+        parser.add_argument('--payment-method', choices=('card', 'bank'), default='card')
+        parser.add_argument('--iamport-delay', type=float, default=0.2,
+                            help='Seconds the fake Iamport server takes to answer')
+        parser.add_argument('--iamport-port', type=int, default=0)
+        parser.add_argument('--url',
+                            help='Test a running server instead of serving the site from this '
+                                 'process. Its IAMPORT_API_URL has to point at --iamport-port.')
+
+    def handle(self, *args, **options):
+        session_keys, option = loadtest.seed(options['users'], options['tickets'])
+        previous = loadtest.open_registration()
+        server = None
+        try:
+            with StubIamportServer(options['iamport_port'], options['iamport_delay']) as stub, \
+                    override_settings(QUERY_INSPECT_ENABLED=True):
+                self.stdout.write('Fake Iamport server at %s' % stub.url)
+                base_url = options['url']
+                if not base_url:
+                    server = loadtest.start_server()
+                    base_url = 'http://127.0.0.1:%d' % server.server_port
+                base_url = base_url.rstrip('/')
+
+                stats, elapsed = loadtest.run(base_url, session_keys, option,
+                                              options['workers'], options['payment_method'])
+        finally:
+            if server:
+                server.shutdown()
+                server.server_close()
+            loadtest.restore_registration(previous)
+        self.stdout.write(loadtest.report(stats, elapsed, option))
@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+from registration.inventory import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recount the sold tickets of every option from the registrations'
+
+    def handle(self, *args, **options):
+        changed = reconcile()
+        for counter, old in changed:
+            self.stdout.write('%s: %d -> %d' % (counter.option or 'Total', old, counter.sold))
+        self.stdout.write('%d counters updated' % len(changed))
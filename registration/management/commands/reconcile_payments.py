@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+from pyconkr.config import config
+from registration.iamporter import get_access_token, Iamporter
+from registration.payments import fetch_payments, reconcile_payments
+
+
+class Command(BaseCommand):
+    help = 'Update pending registrations (e.g. unpaid bank transfers) from Iamport'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Concurrent requests to Iamport')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        client = Iamporter(get_access_token(config.IMP_API_KEY, config.IMP_API_SECRET))
+        payments = fetch_payments(client, workers=options['workers'])
+        summary = reconcile_payments(payments, batch_size=options['batch_size'])
+
+        for (old, new), count in sorted(summary.items()):
+            self.stdout.write('%s -> %s: %d' % (old, new or 'not found', count))
+        self.stdout.write('%d payments fetched, %d registrations checked' % (
+            len(payments), sum(summary.values())))
@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+from registration.inventory import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Give back the tickets held by expired payment reservations'
+
+    def handle(self, *args, **options):
+        self.stdout.write('%d reservations released' % release_expired())
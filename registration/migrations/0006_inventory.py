@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 00:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_counters(apps, schema_editor):
+    Option = apps.get_model('registration', 'Option')
+    Registration = apps.get_model('registration', 'Registration')
+    Inventory = apps.get_model('registration', 'Inventory')
+
+    db = schema_editor.connection.alias
+    sold = Registration.objects.using(db).filter(payment_status__in=['paid', 'ready'])
+    Inventory.objects.using(db).create(option=None, sold=sold.count())
+    for option in Option.objects.using(db).all():
+        Inventory.objects.using(db).create(option=option, sold=sold.filter(option=option).count())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registration', '0005_option_total'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Inventory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sold', models.IntegerField(default=0)),
+                ('reserved', models.IntegerField(default=0)),
+                ('modified', models.DateTimeField(auto_now=True)),
+                ('option', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='inventory', to='registration.Option')),
+            ],
+        ),
+        migrations.RunPython(create_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 00:22
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registration', '0007_reservation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='registration',
+            name='merchant_uid',
+            field=models.CharField(db_index=True, max_length=32),
+        ),
+    ]
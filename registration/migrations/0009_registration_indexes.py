@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 00:23
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registration', '0008_registration_merchant_uid_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='registration',
+            name='merchant_uid',
+            field=models.CharField(max_length=32, unique=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='registration',
+            index_together=set([('option', 'payment_status'), ('user', 'payment_status')]),
+        ),
+    ]
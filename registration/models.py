@@ -4,6 +4,10 @@ from __future__ import unicode_literals
 from django.db import models
 from django.contrib.auth.models import User
 
+# payment statuses that hold a ticket
+SOLD_STATUSES = ('paid', 'ready')
+
+
 class Option(models.Model):
     name = models.CharField(max_length=50)
     description = models.TextField()
@@ -14,7 +18,8 @@ class Option(models.Model):
 
     @property
     def is_soldout(self):
-        return self.total <= Registration.objects.filter(option=self, payment_status__in=['paid', 'ready']).count()
+        from .inventory import remaining
+        return remaining(self) <= 0
 
     def __unicode__(self):
         return self.name
@@ -22,7 +27,7 @@ class Option(models.Model):
 
 class Registration(models.Model):
     user = models.ForeignKey(User)
-    merchant_uid = models.CharField(max_length=32)
+    merchant_uid = models.CharField(max_length=32, unique=True)
     option = models.ForeignKey(Option, null=True)
     name = models.CharField(max_length=100)
     email = models.EmailField(max_length=255)
@@ -46,3 +51,40 @@ class Registration(models.Model):
     vbank_holder = models.CharField(max_length=20, null=True, blank=True)
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # sold ticket counts per option and "is registered" checks per user
+        index_together = [
+            ('option', 'payment_status'),
+            ('user', 'payment_status'),
+        ]
+
+
+class Inventory(models.Model):
+    """
+    Ticket counters of an option, or of the whole conference when `option`
+    is null. Only changed with conditional updates in `registration.inventory`.
+    """
+    option = models.OneToOneField(Option, null=True, blank=True, related_name='inventory')
+    sold = models.IntegerField(default=0)
+    reserved = models.IntegerField(default=0)
+    modified = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        return u'%s: %d sold, %d reserved' % (
+            self.option or 'Total', self.sold, self.reserved)
+
+
+class Reservation(models.Model):
+    """
+    A ticket held for a payment form until `expires`, counted in
+    `Inventory.reserved`.
+    """
+    merchant_uid = models.CharField(max_length=32, unique=True)
+    option = models.ForeignKey(Option)
+    user = models.ForeignKey(User)
+    expires = models.DateTimeField(db_index=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __unicode__(self):
+        return self.merchant_uid
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+import logging
+from collections import Counter
+from multiprocessing.pool import ThreadPool
+
+from django.db import transaction
+
+from . import inventory
+from .models import Registration, SOLD_STATUSES
+
+logger = logging.getLogger(__name__)
+# statuses a pending payment can move to
+FINAL_STATUSES = ('paid', 'cancelled', 'failed')
+
+
+def fetch_payments(client, statuses=FINAL_STATUSES, workers=4):
+    """
+    Return {merchant_uid: payment} of every payment in `statuses`, fetching
+    the pages of the status lists from Iamport with at most `workers`
+    concurrent requests.
+    """
+    pool = ThreadPool(workers)
+    try:
+        first_pages = pool.map(lambda status: client.find_by_status(status, 1), statuses)
+
+        page_args = []
+        for status, first in zip(statuses, first_pages):
+            per_page = len(first['list']) or 1
+            pages = (first['total'] + per_page - 1) // per_page
+            page_args.extend((status, page) for page in range(2, pages + 1))
+        other_pages = pool.map(lambda args: client.find_by_status(*args), page_args)
+    finally:
+        pool.close()
+        pool.join()
+
+    payments = {}
+    for page in first_pages + other_pages:
+        for payment in page['list']:
+            payments[payment['merchant_uid']] = payment
+    return payments
+
+
+def _changes(registration, payment):
+    changes = {
+        'payment_status': payment.get('status'),
+        'payment_message': payment.get('fail_reason') or payment.get('cancel_reason'),
+    }
+    if payment.get('pg_tid'):
+        changes['transaction_code'] = payment['pg_tid']
+    # virtual bank account of a vbank payment, where to send the money
+    for field in ('vbank_name', 'vbank_num', 'vbank_date', 'vbank_holder'):
+        if payment.get(field):
+            changes[field] = unicode(payment[field])
+    return tuple(sorted((k, v) for k, v in changes.items()
+                        if getattr(registration, k) != v))
+
+
+def update_registration(registration, payment):
+    """
+    Update `registration` from the Iamport `payment`. Does nothing when the
+    registration is already up to date or was changed concurrently, so it is
+    safe to call repeatedly for the same payment. Returns whether the row was
+    updated.
+    """
+    changes = _changes(registration, payment)
+    if not changes:
+        return False
+
+    old_status = registration.payment_status
+    with transaction.atomic():
+        updated = Registration.objects \
+            .filter(pk=registration.pk, payment_status=old_status) \
+            .update(**dict(changes))
+        if updated and old_status in SOLD_STATUSES and payment['status'] not in SOLD_STATUSES:
+            inventory.release(registration.option)
+        elif updated and old_status not in SOLD_STATUSES and payment['status'] in SOLD_STATUSES:
+            try:
+                inventory.claim(registration.option)
+            except inventory.SoldOut:
+                # the money is taken already, count the ticket anyway
+                logger.error('Payment %s accepted for sold out %s',
+                             registration.merchant_uid, registration.option)
+                inventory.force_claim(registration.option)
+    for field, value in changes:
+        setattr(registration, field, value)
+    return bool(updated)
+
+
+def reconcile_payments(payments, pending=('ready',), batch_size=500):
+    """
+    Update the registrations in `pending` statuses from `payments`, paging
+    through them `batch_size` rows at a time. Rows getting the same changes
+    are written with a single UPDATE per batch.
+
+    Returns a Counter of (old status, new status) -> rows, where new status
+    is None for registrations Iamport does not know about.
+    """
+    summary = Counter()
+    registrations = Registration.objects.filter(payment_status__in=pending).order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(registrations.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+
+        updates = {}
+        for registration in batch:
+            payment = payments.get(registration.merchant_uid)
+            if payment is None:
+                summary[(registration.payment_status, None)] += 1
+                continue
+            summary[(registration.payment_status, payment['status'])] += 1
+            changes = _changes(registration, payment)
+            if not changes:
+                continue
+            key = (changes, registration.payment_status, registration.option_id)
+            updates.setdefault(key, []).append(registration.pk)
+
+        with transaction.atomic():
+            for (changes, old_status, option_id), pks in updates.items():
+                # only rows still in the old status, in case a webhook updated
+                # them meanwhile and gave their tickets back already
+                updated = Registration.objects.filter(pk__in=pks, payment_status=old_status) \
+                    .update(**dict(changes))
+                new_status = dict(changes).get('payment_status', old_status)
+                if old_status in SOLD_STATUSES and new_status not in SOLD_STATUSES:
+                    for i in range(updated):
+                        inventory.release(option_id)
+    return summary
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+from constance.backends.database.models import Constance
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from pyconkr.caching import bump_version
+from .models import Option
+
+
+@receiver(post_save, sender=Option)
+@receiver(post_delete, sender=Option)
+@receiver(post_save, sender=Constance)
+@receiver(post_delete, sender=Constance)
+def invalidate_registration_state(sender, **kwargs):
+    bump_version('registration')
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import datetime
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from pyconkr.caching import get_version
+from pyconkr.config import config
+from pyconkr.routers import use_primary
+from . import inventory
+from .models import Option
+
+
+def _build_state():
+    options = list(Option.objects.filter(is_active=True).select_related('inventory').order_by('id'))
+    for option in options:
+        option.remaining = inventory.remaining(option)
+    return {
+        'open': datetime.datetime.combine(config.REGISTRATION_OPEN, config.REGISTRATION_OPEN_TIME),
+        'close': datetime.datetime.combine(config.REGISTRATION_CLOSE, config.REGISTRATION_CLOSE_TIME),
+        'remaining': inventory.remaining(),
+        'options': options,
+    }
+
+
+def get_registration_state():
+    """
+    Return the registration window, the active options and the remaining
+    ticket counts, as a dict with `open`, `close`, `remaining` and `options`.
+
+    While the registration is open, the snapshot is kept for
+    REGISTRATION_STATE_CACHE_TIMEOUT seconds only, as the counts change all the
+    time; it is only used for display, sales are checked by the inventory.
+    Otherwise it is kept until the registration opens or closes, at most
+    REGISTRATION_STATE_IDLE_CACHE_TIMEOUT seconds. Saving an option or a
+    config value drops it.
+    """
+    now = datetime.datetime.now()
+    version = get_version('registration')
+    state = cache.get('registration:state', version=version)
+    if state is not None:
+        return state
+
+    with use_primary():
+        state = _build_state()
+    timeout = settings.REGISTRATION_STATE_IDLE_CACHE_TIMEOUT
+    if now < state['open']:
+        timeout = min(timeout, int(math.ceil((state['open'] - now).total_seconds())))
+    elif now <= state['close']:
+        timeout = settings.REGISTRATION_STATE_CACHE_TIMEOUT
+    if timeout > 0:
+        cache.set('registration:state', state, timeout, version=version)
+    return state
+
+
+def is_ticket_open(state=None):
+    state = state or get_registration_state()
+    return state['open'] <= datetime.datetime.now() <= state['close']
@@ -1,12 +1,29 @@
 # -*- coding: utf-8 -*-
 import datetime
+import json
+from StringIO import StringIO
 
-from django.test import TestCase
+import requests
+
+from django.test import TestCase, LiveServerTestCase
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
+from django.test.utils import override_settings
+from django.db import IntegrityError
+from django.db.models.signals import post_init, pre_save
+from django.utils import timezone
 from constance.test import override_config
+from pyconkr.config import config
 
-from models import Option
+from models import Option, Registration, Inventory, Reservation
+from iamporter import Iamporter, IamporterError, get_access_token, get_session, clear_access_tokens
+from iamport_stub import StubIamportServer
+from payments import reconcile_payments, update_registration
+import inventory
+import loadtest
+from state import get_registration_state, is_ticket_open
 
 User = get_user_model()
 
@@ -19,3 +36,411 @@ class RegistrationTest(TestCase):
         self.client.login(username='testname', password='testpassword')
         response = self.client.get(reverse('registration_payment', args=[option.id]))
         self.assertIn('additional_price', response.context['form'].fields)
+
+
+@override_config(TOTAL_TICKET=3)
+class InventoryTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('testname', 'test@test.com', 'testpassword')
+        self.option = Option.objects.create(name='regular', price=1000, total=2, is_active=True)
+
+    def test_claim_until_sold_out(self):
+        inventory.claim(self.option)
+        inventory.claim(self.option)
+        self.assertTrue(self.option.is_soldout)
+        with self.assertRaises(inventory.SoldOut) as cm:
+            inventory.claim(self.option)
+        self.assertEqual(cm.exception.option, self.option)
+        # the failed claim does not keep the global ticket
+        self.assertEqual(inventory.remaining(), 1)
+
+        other = Option.objects.create(name='student', price=500, total=10, is_active=True)
+        inventory.claim(other)
+        with self.assertRaises(inventory.SoldOut) as cm:
+            inventory.claim(other)
+        self.assertIsNone(cm.exception.option)
+
+        inventory.release(self.option)
+        self.assertFalse(Option.objects.get(pk=self.option.pk).is_soldout)
+        self.assertEqual(inventory.remaining(), 1)
+
+    def test_soldout_check_uses_counter(self):
+        inventory.claim(self.option)
+        option = Option.objects.select_related('inventory').get(pk=self.option.pk)
+        with self.assertNumQueries(0):
+            self.assertFalse(option.is_soldout)
+
+    def test_reconcile(self):
+        inventory.claim(self.option)
+        inventory.claim(self.option)
+        Registration.objects.create(user=self.user, option=self.option, merchant_uid='a',
+                                    payment_status='paid')
+        Registration.objects.create(user=self.user, option=self.option, merchant_uid='b',
+                                    payment_status='failed')
+
+        out = StringIO()
+        call_command('reconcile_inventory', stdout=out)
+        self.assertIn('2 counters updated', out.getvalue())
+        self.assertEqual(Inventory.objects.get(option=self.option).sold, 1)
+        self.assertEqual(inventory.remaining(), 2)
+
+
+@override_config(TOTAL_TICKET=3)
+class ReservationTest(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user('user%d' % i, 'user%d@test.com' % i, 'password')
+                      for i in range(3)]
+        self.option = Option.objects.create(name='regular', price=1000, total=2, is_active=True)
+
+    def test_reservations_hold_tickets(self):
+        inventory.reserve(self.option, 'uid0', self.users[0])
+        inventory.reserve(self.option, 'uid1', self.users[1])
+        self.assertTrue(Option.objects.get(pk=self.option.pk).is_soldout)
+        with self.assertRaises(inventory.SoldOut):
+            inventory.reserve(self.option, 'uid2', self.users[2])
+        with self.assertRaises(inventory.SoldOut):
+            inventory.claim(self.option)
+
+        # only by the user holding it
+        with self.assertRaises(inventory.SoldOut):
+            inventory.claim(self.option, 'uid0', self.users[1])
+
+        # a reserved ticket can always be bought
+        inventory.claim(self.option, 'uid0', self.users[0])
+        counter = Inventory.objects.get(option=self.option)
+        self.assertEqual((counter.sold, counter.reserved), (1, 1))
+        self.assertFalse(Reservation.objects.filter(merchant_uid='uid0').exists())
+
+    def test_live_reservation_is_reused(self):
+        inventory.reserve(self.option, 'uid0', self.users[0])
+        reservation = inventory.reserve(self.option, 'uid1', self.users[0])
+        self.assertEqual(reservation.merchant_uid, 'uid0')
+        self.assertEqual(Reservation.objects.count(), 1)
+        self.assertEqual(Inventory.objects.get(option=self.option).reserved, 1)
+
+    def test_new_reservation_replaces_previous_one(self):
+        other = Option.objects.create(name='patron', price=5000, total=2, is_active=True)
+        inventory.reserve(self.option, 'uid0', self.users[0])
+        inventory.reserve(other, 'uid1', self.users[0])
+        self.assertEqual(Inventory.objects.get(option=self.option).reserved, 0)
+        self.assertEqual(Inventory.objects.get(option=other).reserved, 1)
+        self.assertEqual(inventory.remaining(), 2)
+
+    def test_release_expired(self):
+        inventory.reserve(self.option, 'uid0', self.users[0])
+        inventory.reserve(self.option, 'uid1', self.users[1])
+        Reservation.objects.filter(merchant_uid='uid0').update(
+            expires=timezone.now() - datetime.timedelta(minutes=1))
+
+        out = StringIO()
+        call_command('release_reservations', stdout=out)
+        self.assertIn('1 reservations released', out.getvalue())
+        self.assertEqual(Inventory.objects.get(option=self.option).reserved, 1)
+        self.assertEqual(inventory.remaining(), 2)
+
+        # an expired reservation is bought like any other ticket
+        inventory.claim(self.option, 'uid0', self.users[0])
+        self.assertEqual(inventory.remaining(self.option), 0)
+
+    def test_expired_reservations_are_swept_when_sold_out(self):
+        inventory.reserve(self.option, 'uid0', self.users[0])
+        inventory.reserve(self.option, 'uid1', self.users[1])
+        Reservation.objects.update(expires=timezone.now() - datetime.timedelta(minutes=1))
+
+        # nobody ran release_reservations
+        inventory.reserve(self.option, 'uid2', self.users[2])
+        inventory.claim(self.option)
+        counter = Inventory.objects.get(option=self.option)
+        self.assertEqual((counter.sold, counter.reserved), (1, 1))
+        self.assertEqual(list(Reservation.objects.values_list('merchant_uid', flat=True)), ['uid2'])
+
+
+class IamporterTest(TestCase):
+    def test_access_token_is_reused(self):
+        with StubIamportServer() as stub:
+            self.assertEqual(get_access_token('key', 'secret'), 'token1')
+            self.assertEqual(get_access_token('key', 'secret'), 'token1')
+            self.assertEqual(stub.tokens, 1)
+
+            # refreshed shortly before it expires
+            stub.token_lifetime = 30
+            clear_access_tokens()
+            get_access_token('key', 'secret')
+            self.assertEqual(get_access_token('key', 'secret'), 'token3')
+
+    def test_find_by_merchant_uid(self):
+        with StubIamportServer() as stub:
+            stub.payments['uid0'] = {'merchant_uid': 'uid0', 'status': 'paid', 'amount': 1000}
+            client = Iamporter(get_access_token('key', 'secret'))
+            self.assertEqual(client.find_by_merchant_uid('uid0')['status'], 'paid')
+            with self.assertRaises(IamporterError):
+                client.find_by_merchant_uid('uid1')
+        self.assertIs(get_session(), get_session())
+
+
+class ReconcilePaymentsTest(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('testname', 'test@test.com', 'testpassword')
+        self.option = Option.objects.create(name='regular', price=1000, total=10, is_active=True)
+        for i in range(6):
+            Registration.objects.create(user=user, option=self.option, merchant_uid='uid%d' % i,
+                                        payment_method='bank', payment_status='ready')
+        Registration.objects.create(user=user, option=self.option, merchant_uid='card',
+                                    payment_status='paid')
+        inventory.reconcile()
+
+    def test_reconcile_payments(self):
+        with StubIamportServer() as stub:
+            for i in range(4):
+                stub.payments['uid%d' % i] = {'merchant_uid': 'uid%d' % i, 'status': 'paid',
+                                              'pg_tid': 'tid%d' % i}
+            stub.payments['uid4'] = {'merchant_uid': 'uid4', 'status': 'cancelled',
+                                     'cancel_reason': 'refund'}
+            stub.payments['card'] = {'merchant_uid': 'card', 'status': 'paid'}
+
+            out = StringIO()
+            call_command('reconcile_payments', '--batch-size=2', stdout=out)
+
+        self.assertIn('ready -> paid: 4', out.getvalue())
+        self.assertIn('ready -> cancelled: 1', out.getvalue())
+        self.assertIn('ready -> not found: 1', out.getvalue())
+        # two pages of paid payments were fetched
+        self.assertIn(('GET', '/payments/status/paid?page=2'), stub.requests)
+
+        self.assertEqual(Registration.objects.filter(payment_status='paid').count(), 5)
+        self.assertEqual(Registration.objects.get(merchant_uid='uid2').transaction_code, 'tid2')
+        cancelled = Registration.objects.get(merchant_uid='uid4')
+        self.assertEqual((cancelled.payment_status, cancelled.payment_message),
+                         ('cancelled', 'refund'))
+        self.assertEqual(Registration.objects.get(merchant_uid='uid5').payment_status, 'ready')
+        self.assertEqual(Inventory.objects.get(option=self.option).sold, 6)
+
+
+    def test_rows_updated_meanwhile_are_not_released_twice(self):
+        payments = {'uid%d' % i: {'merchant_uid': 'uid%d' % i, 'status': 'cancelled'}
+                    for i in range(2)}
+
+        def webhook(sender, instance, **kwargs):
+            # uid0 is cancelled by a notification right after the batch is read
+            if instance.merchant_uid == 'uid0':
+                post_init.disconnect(webhook, sender=Registration)
+                update_registration(Registration.objects.get(pk=instance.pk), payments['uid0'])
+
+        post_init.connect(webhook, sender=Registration)
+        try:
+            reconcile_payments(payments)
+        finally:
+            post_init.disconnect(webhook, sender=Registration)
+
+        self.assertEqual(Registration.objects.filter(payment_status='cancelled').count(), 2)
+        self.assertEqual(Inventory.objects.get(option=self.option).sold, 5)
+
+
+@override_config(REGISTRATION_OPEN=datetime.date.today(),
+                 REGISTRATION_CLOSE=datetime.date.today() + datetime.timedelta(days=1))
+class PaymentProcessTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user('testname', 'test@test.com', 'testpassword')
+        self.client.login(username='testname', password='testpassword')
+        self.option = Option.objects.create(name='regular', price=1000, total=10, is_active=True)
+
+    def pay(self):
+        return self.client.post(reverse('registration_payment'), {
+            'merchant_uid': 'uid0', 'token': 'token', 'card_number': '4111-1111-1111-1111',
+            'expiry': '2020-12', 'birth': '', 'name': 'Test', 'email': 'test@test.com',
+            'base_price': 1000, 'additional_price': 0, 'company': '',
+            'phone_number': '010-0000-0000', 'payment_method': 'card', 'option': self.option.pk,
+        })
+
+    def test_ticket_is_given_back_when_the_gateway_fails(self):
+        with override_settings(IAMPORT_API_URL='http://127.0.0.1:1', IAMPORT_MAX_RETRIES=0):
+            get_session().close()
+            with self.assertRaises(requests.ConnectionError):
+                self.pay()
+        self.assertFalse(Registration.objects.exists())
+        self.assertEqual(Inventory.objects.get(option=self.option).sold, 0)
+        self.assertEqual(inventory.remaining(), config.TOTAL_TICKET)
+
+    def test_paid_ticket_is_kept(self):
+        with StubIamportServer():
+            self.assertTrue(json.loads(self.pay().content)['success'])
+        self.assertEqual(Registration.objects.get().payment_status, 'paid')
+        self.assertEqual(Inventory.objects.get(option=self.option).sold, 1)
+
+    def test_retry_after_a_declined_card_reuses_the_row(self):
+        Registration.objects.create(user=User.objects.get(), option=self.option,
+                                    merchant_uid='uid0', payment_status='failed',
+                                    payment_message='declined')
+        with StubIamportServer():
+            self.assertTrue(json.loads(self.pay().content)['success'])
+        registration = Registration.objects.get()
+        self.assertEqual((registration.payment_status, registration.payment_message),
+                         ('paid', None))
+
+        with StubIamportServer():
+            self.assertFalse(json.loads(self.pay().content)['success'])
+        self.assertEqual(Inventory.objects.get(option=self.option).sold, 1)
+
+    def test_concurrent_duplicate_is_rejected(self):
+        def insert_first(sender, instance, **kwargs):
+            if instance.pk is None and instance.merchant_uid == 'uid0':
+                pre_save.disconnect(insert_first, sender=Registration)
+                Registration.objects.create(user=instance.user, option=self.option,
+                                            merchant_uid='uid0', payment_status='paid')
+
+        pre_save.connect(insert_first, sender=Registration)
+        try:
+            with StubIamportServer():
+                response = json.loads(self.pay().content)
+        finally:
+            pre_save.disconnect(insert_first, sender=Registration)
+        self.assertEqual(response, {'success': False, 'message': u'이미 처리된 결제입니다'})
+        self.assertEqual(Inventory.objects.get(option=self.option).sold, 0)
+
+
+class PaymentCallbackTest(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('testname', 'test@test.com', 'testpassword')
+        self.option = Option.objects.create(name='regular', price=1000, total=10, is_active=True)
+        self.registration = Registration.objects.create(
+            user=user, option=self.option, merchant_uid='uid0', payment_method='card',
+            payment_status='ready')
+        inventory.reconcile()
+
+    def notify(self, merchant_uid='uid0', status='paid'):
+        return self.client.post(reverse('registration_payment_callback'),
+                                {'imp_uid': 'imp0', 'merchant_uid': merchant_uid, 'status': status})
+
+    def test_notification_is_verified_and_idempotent(self):
+        with StubIamportServer() as stub:
+            stub.payments['uid0'] = {'merchant_uid': 'uid0', 'status': 'paid', 'amount': 1000,
+                                     'pg_tid': 'tid0'}
+            self.assertEqual(self.notify().status_code, 200)
+            registration = Registration.objects.get(pk=self.registration.pk)
+            self.assertEqual((registration.payment_status, registration.transaction_code),
+                             ('paid', 'tid0'))
+
+            self.assertEqual(self.notify().status_code, 200)
+            self.assertFalse(update_registration(registration, stub.payments['uid0']))
+
+            # the posted status is ignored, only the fetched payment counts
+            self.assertEqual(self.notify(status='cancelled').status_code, 200)
+            self.assertEqual(Registration.objects.get(pk=self.registration.pk).payment_status,
+                             'paid')
+
+            stub.payments['uid0'].update(status='cancelled')
+            self.notify(status='cancelled')
+            self.assertEqual(Registration.objects.get(pk=self.registration.pk).payment_status,
+                             'cancelled')
+            self.assertEqual(Inventory.objects.get(option=self.option).sold, 0)
+
+    def test_failed_payment_paid_later_takes_a_ticket(self):
+        Registration.objects.filter(pk=self.registration.pk).update(payment_status='failed')
+        inventory.reconcile()
+        with StubIamportServer() as stub:
+            stub.payments['uid0'] = {'merchant_uid': 'uid0', 'status': 'paid', 'amount': 1000,
+                                     'vbank_name': u'국민은행', 'vbank_num': '123-456',
+                                     'vbank_date': 1467331200, 'vbank_holder': u'파이콘'}
+            self.assertEqual(self.notify().status_code, 200)
+        registration = Registration.objects.get(pk=self.registration.pk)
+        self.assertEqual(registration.payment_status, 'paid')
+        self.assertEqual((registration.vbank_num, registration.vbank_date), ('123-456', '1467331200'))
+        self.assertFalse(update_registration(registration, stub.payments['uid0']))
+        self.assertEqual(Inventory.objects.get(option=self.option).sold, 1)
+        self.assertEqual(Inventory.objects.get(option=None).sold, 1)
+
+    def test_paid_for_sold_out_option_is_still_counted(self):
+        Registration.objects.filter(pk=self.registration.pk).update(payment_status='cancelled')
+        inventory.reconcile()
+        Option.objects.filter(pk=self.option.pk).update(total=0)
+        with StubIamportServer() as stub:
+            stub.payments['uid0'] = {'merchant_uid': 'uid0', 'status': 'paid', 'amount': 1000}
+            self.assertEqual(self.notify().status_code, 200)
+        self.assertEqual(Inventory.objects.get(option=self.option).sold, 1)
+
+    def test_rejected_notifications(self):
+        with StubIamportServer() as stub:
+            stub.payments['uid0'] = {'merchant_uid': 'uid0', 'status': 'paid', 'amount': 10}
+            self.assertEqual(self.notify().status_code, 400)
+            self.assertEqual(self.notify('unknown').status_code, 404)
+            self.assertEqual(self.client.get(reverse('registration_payment_callback')).status_code, 405)
+        self.assertEqual(Registration.objects.get(pk=self.registration.pk).payment_status, 'ready')
+
+
+class RegistrationIndexTest(TestCase):
+    def test_merchant_uid_is_unique(self):
+        user = User.objects.create_user('testname', 'test@test.com', 'testpassword')
+        Registration.objects.create(user=user, merchant_uid='uid0', payment_status='paid')
+        with self.assertRaises(IntegrityError):
+            Registration.objects.create(user=user, merchant_uid='uid0', payment_status='paid')
+
+
+class QueryBenchmarkTest(TestCase):
+    def test_benchmark_cleans_up(self):
+        out = StringIO()
+        call_command('benchmark_registration_queries', '--rows', '20', '40', '--repeat=1', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 7)
+        self.assertFalse(Registration.objects.exists())
+        self.assertFalse(User.objects.exists())
+
+
+class SQLiteBenchmarkTest(TestCase):
+    def test_sqlite_benchmark_uses_a_scratch_database(self):
+        out = StringIO()
+        call_command('benchmark_sqlite', '--seconds=0.2', '--users=10', '--readers=2',
+                     '--writers=1', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[0] for line in lines], ['pragmas', 'defaults', 'tuned'])
+        self.assertFalse(Registration.objects.exists())
+
+
+class LoadTestTest(LiveServerTestCase):
+    def test_rush_does_not_oversell(self):
+        session_keys, option = loadtest.seed(6, 3)
+        loadtest.open_registration()
+        with StubIamportServer():
+            stats, elapsed = loadtest.run(self.live_server_url, session_keys, option, 3)
+
+        self.assertEqual(stats.outcomes, {'bought': 3, 'sold out': 3})
+        self.assertEqual(len(stats.requests['payment_process']), 3)
+        self.assertEqual(loadtest.oversold(option), (0, 0))
+        self.assertIn('oversold: 0 of the option, 0 in total',
+                      loadtest.report(stats, elapsed, option))
+
+    def test_percentile(self):
+        values = range(1, 101)
+        self.assertEqual(loadtest.percentile(values, 50), 50)
+        self.assertEqual(loadtest.percentile(values, 99), 99)
+        self.assertEqual(loadtest.percentile([3], 95), 3)
+
+
+@override_config(REGISTRATION_OPEN=datetime.date.today() - datetime.timedelta(days=1),
+                 REGISTRATION_CLOSE=datetime.date.today() + datetime.timedelta(days=1))
+class RegistrationStateTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.option = Option.objects.create(name='regular', price=1000, total=10, is_active=True)
+        Option.objects.create(name='hidden', price=1000, total=10)
+
+    def test_state_is_cached(self):
+        state = get_registration_state()
+        self.assertTrue(is_ticket_open(state))
+        self.assertEqual([o.name for o in state['options']], ['regular'])
+        self.assertEqual(state['options'][0].remaining, 10)
+
+        # warm the caches of the base template
+        self.client.get(reverse('registration_index'))
+        with self.assertNumQueries(0):
+            get_registration_state()
+            self.client.get(reverse('registration_index'))
+
+    def test_state_is_invalidated(self):
+        get_registration_state()
+        self.option.price = 2000
+        self.option.save()
+        self.assertEqual(get_registration_state()['options'][0].price, 2000)
+
+        with override_config(REGISTRATION_CLOSE=datetime.date.today() - datetime.timedelta(days=1)):
+            self.assertFalse(is_ticket_open())
+        self.assertTrue(is_ticket_open())
@@ -8,6 +8,7 @@ urlpatterns = [
     url(r'^status/$', views.status, name='registration_status'),
     url(r'^payment/(\d*)/$', views.payment, name='registration_payment'),
     url(r'^payment/$', views.payment_process, name='registration_payment'),
+    url(r'^payment/callback/$', views.payment_callback, name='registration_payment_callback'),
     url(r'^receipt/$',
         login_required(views.RegistrationReceiptDetail.as_view()), name='registration_receipt'),
 ]
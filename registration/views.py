@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
 import logging
-import datetime
 from uuid import uuid4
 
 from django.shortcuts import render, redirect, get_object_or_404
@@ -8,22 +7,23 @@ from django.http import HttpResponse, JsonResponse
 from django.utils.translation import ugettext as _
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.db import IntegrityError, transaction
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from django.views.generic import DetailView
-from constance import config
+from pyconkr.config import config
 
 from pyconkr.helper import send_email_ticket_confirm, render_io_error
 from .forms import RegistrationForm, RegistrationAdditionalPriceForm
-from .models import Option, Registration
+from .models import Option, Registration, SOLD_STATUSES
+from . import inventory
+from .payments import update_registration
+from .state import get_registration_state, is_ticket_open
 from iamporter import get_access_token, Iamporter, IamporterError
 
 logger = logging.getLogger(__name__)
 payment_logger = logging.getLogger('payment')
 
-def _is_ticket_open():
-    open_datetime = datetime.datetime.combine(config.REGISTRATION_OPEN, config.REGISTRATION_OPEN_TIME)
-    close_datetime = datetime.datetime.combine(config.REGISTRATION_CLOSE, config.REGISTRATION_CLOSE_TIME)
-    return True if open_datetime <= datetime.datetime.now() <= close_datetime else False
-
 def index(request):
     if request.user.is_authenticated():
         is_registered = Registration.objects.filter(
@@ -32,10 +32,11 @@ def index(request):
         ).exists()
     else:
         is_registered = False
-    options = Option.objects.filter(is_active=True)
+    state = get_registration_state()
     return render(request, 'registration/info.html',
-                  {'is_ticket_open': _is_ticket_open,
-                   'options': options,
+                  {'is_ticket_open': is_ticket_open(state),
+                   'is_sold_out': state['remaining'] <= 0,
+                   'options': state['options'],
                    'is_registered': is_registered})
 
 
@@ -52,7 +53,7 @@ def status(request):
 @login_required
 def payment(request, option_id):
 
-    if not _is_ticket_open():
+    if not is_ticket_open():
         return redirect('registration_info')
 
     product = Option.objects.get(id=option_id)
@@ -64,7 +65,12 @@ def payment(request, option_id):
     if is_registered:
         return redirect('registration_status')
 
-    uid = str(uuid4()).replace('-', '')
+    try:
+        reservation = inventory.reserve(product, str(uuid4()).replace('-', ''), request.user)
+    except inventory.SoldOut:
+        return redirect('registration_index')
+    uid = reservation.merchant_uid
+
     if product.has_additional_price:
         form = RegistrationAdditionalPriceForm(initial={'email': request.user.email,
                                                         'option': product,
@@ -100,16 +106,20 @@ def payment_process(request):
             'message': form_errors_string,  # TODO : ...
         })
 
-    remain_ticket_count = (config.TOTAL_TICKET - Registration.objects.filter(payment_status__in=['paid', 'ready']).count())
-
-    # sold out
-    if remain_ticket_count <= 0:
-        return JsonResponse({
-            'success': False,
-            'message': u'티켓이 매진 되었습니다',
-        })
+    # merchant_uid is unique, a resubmitted form must not charge twice, but
+    # the user may retry with the same uid after a declined card
+    already_processed = JsonResponse({
+        'success': False,
+        'message': u'이미 처리된 결제입니다',
+    })
+    previous = Registration.objects.filter(merchant_uid=request.POST.get('merchant_uid')).first()
+    if previous and (previous.user_id != request.user.pk or
+                     previous.payment_status in SOLD_STATUSES):
+        return already_processed
 
     registration = Registration(
+            id = previous.pk if previous else None,
+            created = previous.created if previous else None,
             user=request.user,
             name = form.cleaned_data.get('name'),
             email = request.user.email,
@@ -120,12 +130,19 @@ def payment_process(request):
             option = form.cleaned_data.get('option'),
             payment_method = form.cleaned_data.get('payment_method')
         )
-    
-    # sold out
-    if registration.option.is_soldout:
+
+    # take a ticket before calling the payment gateway, give it back on failure
+    saved = False
+    try:
+        inventory.claim(registration.option, registration.merchant_uid, request.user)
+    except inventory.SoldOut as e:
+        if e.option is None:
+            message = u'티켓이 매진 되었습니다'
+        else:
+            message = u'{name} 티켓이 매진 되었습니다'.format(name=e.option.name)
         return JsonResponse({
             'success': False,
-            'message': u'{name} 티켓이 매진 되었습니다'.format(name=registration.option.name),
+            'message': message,
         })
 
     try:
@@ -148,14 +165,16 @@ def payment_process(request):
             )
             if request.POST.get('birth') == '':
                 # foreign payment
-                imp_client.foreign(**imp_params)
+                confirm = imp_client.foreign(**imp_params)
             else:
-                imp_client.foreign(**imp_params)
+                confirm = imp_client.foreign(**imp_params)
                 # imp_client.onetime(**imp_params)
-            confirm = imp_client.find_by_merchant_uid(request.POST.get('merchant_uid'))
+            if settings.IAMPORT_CONFIRM_PAYMENT:
+                confirm = imp_client.find_by_merchant_uid(request.POST.get('merchant_uid'))
 
             if confirm['amount'] != product.price + registration.additional_price:
                 # TODO : cancel
+                inventory.release(product)
                 return render_io_error("amount is not same as product.price. it will be canceled")
 
             registration.transaction_code = confirm.get('pg_tid')
@@ -166,28 +185,84 @@ def payment_process(request):
             registration.vbank_num = confirm.get('vbank_num', None)
             registration.vbank_date = confirm.get('vbank_date', None)
             registration.vbank_holder = confirm.get('vbank_holder', None)
-            registration.save()
+            with transaction.atomic():
+                registration.save()
+            saved = True
+            if registration.payment_status not in SOLD_STATUSES:
+                inventory.release(product)
         elif registration.payment_method == 'bank':
             registration.payment_status = 'ready'
-            registration.save()
+            with transaction.atomic():
+                registration.save()
+            saved = True
         else:
             raise Exception('Unknown payment method')
 
         if not settings.DEBUG:
             send_email_ticket_confirm(request, registration)
     except IamporterError as e:
+        if not saved:
+            inventory.release(registration.option)
         # TODO : other status code
         return JsonResponse({
             'success': False,
             'code': e.code,
             'message': e.message,
         })
+    except IntegrityError:
+        # a concurrent request saved the same merchant_uid first
+        if not saved:
+            inventory.release(registration.option)
+        return already_processed
+    except Exception:
+        # gateway errors or timeouts: nothing was saved, so the claimed
+        # ticket is still ours to give back
+        if not saved:
+            inventory.release(registration.option)
+        raise
     else:
         return JsonResponse({
             'success': True,
         })
 
 
+@csrf_exempt
+@require_POST
+def payment_callback(request):
+    """
+    Receive the payment notifications of Iamport. The notification is not
+    trusted: the payment is fetched from Iamport before the registration is
+    updated, so repeated or forged notifications change nothing.
+    """
+    payment_logger.debug(request.POST)
+    merchant_uid = request.POST.get('merchant_uid')
+    if not merchant_uid:
+        return HttpResponse(status=400)
+
+    registration = Registration.objects.filter(merchant_uid=merchant_uid) \
+        .select_related('option').first()
+    if registration is None:
+        return HttpResponse(status=404)
+
+    try:
+        access_token = get_access_token(config.IMP_API_KEY, config.IMP_API_SECRET)
+        payment = Iamporter(access_token).find_by_merchant_uid(merchant_uid)
+    except IamporterError as e:
+        logger.warning('Payment %s not found: %s', merchant_uid, e.message)
+        return HttpResponse(status=404)
+    except IOError:
+        # let Iamport send the notification again
+        return HttpResponse(status=503)
+
+    expected = registration.option.price + registration.additional_price
+    if payment.get('status') == 'paid' and payment.get('amount') != expected:
+        logger.error('Payment %s amount %s is not %s', merchant_uid, payment.get('amount'), expected)
+        return HttpResponse(status=400)
+
+    update_registration(registration, payment)
+    return HttpResponse('OK')
+
+
 class RegistrationReceiptDetail(DetailView):
     def get_object(self, queryset=None):
         return get_object_or_404(Registration, user_id=self.request.user.pk)